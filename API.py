@@ -1,102 +1,364 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import os
-from dotenv import load_dotenv
 import json
+import threading
+import time
 
-load_dotenv()  # 加载.env文件
-
-# 构建Fofa API请求
-def fofa_search(query, fields='banner', page=1, size=100):
-    email = os.getenv('FOFA_EMAIL')
-    key = os.getenv('FOFA_KEY')
-    base_url = "https://fofa.info/api/v1/search/all"
-    params = {
-        'email': email,
-        'key': key,
-        'qbase64': base64.b64encode(query.encode()).decode(),
-        'fields': fields,
-        'page': page,
-        'size': size,
-    }
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": f"Request failed with status code {response.status_code}"}
-    
-# 构建Fofa API统计请求
-def fofa_stats(query: str, fields: str = 'product1,product5,category1,category5'):
-    email = os.getenv('FOFA_EMAIL')
-    key = os.getenv('FOFA_KEY')
-    base_url = "https://fofa.info/api/v1/search/stats"
-    params = {
-        'email': email,
-        'key': key,
-        'qbase64': base64.b64encode(query.encode()).decode(),
-        'fields': 'product1,product5,category1,category5',
-    }
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": f"Request failed with status code {response.status_code}"}
-
-# 构建FOFA API的Host请求
-def fofa_host(host):
-    email = os.getenv('FOFA_EMAIL')
-    key = os.getenv('FOFA_KEY')
-    base_url = "https://fofa.info/api/v1/host/{host}"
-    params = {
-        'email': email,
-        'key': key,
-    }
-    url = base_url.format(host=host)
-    response = requests.get(url, params=params)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": f"Request failed with status code {response.status_code}"}
-
-# 构建流式查询
-def fofa_stream(query):
-    email = os.getenv('FOFA_EMAIL')
-    key = os.getenv('FOFA_KEY')
-    base_url = "https://fofa.info/api/v1/stream/search/all"
-    params = {
-        'email': email,
-        'key': key,
-        'qbase64': base64.b64encode(query.encode()).decode(),
-        'fields': 'host,title,header,product',
-        'size': 100,  # 设置每次请求的结果数量
-    }
-    response = requests.get(base_url, params=params, stream=True)
-    
-    if response.status_code == 200:
-        return response.iter_lines()
-    else:
-        return {"error": f"Request failed with status code {response.status_code}"}
-
-# 查询规则标签
-def fofa_tags():
-    email = os.getenv('FOFA_EMAIL')
-    key = os.getenv('FOFA_KEY')
-    base_url = "https://fofa.info/api/v1/rule_tags/query"
-    params = {
-        'email': email,
-        'key': key,
-        'value': '网络摄像头',
-        'field': 'title',
-    }
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": f"Request failed with status code {response.status_code}"}
+from cache import SQLiteCache
+from config import load_env
+from fofa_query import canonicalize, QueryError
+from metrics import record_fofa, record_fofa_cache_hit
+
+load_env()  # 加载.env文件
+
+FOFA_BASE_URL = "https://fofa.info"
+DEFAULT_TIMEOUT = (5, 30)  # (连接超时, 读取超时)，单位秒
+
+# 各接口的限速配置：(每秒补充的令牌数, 桶容量)，可按账号等级调整
+RATE_LIMITS = {
+    'search': (2.0, 5),
+    'stats': (1 / 5, 1),  # 统计聚合每5秒只允许查询一次
+    'host': (1.0, 1),
+    'rule_tags': (1.0, 1),
+}
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶，同时支持同步阻塞和asyncio等待
+
+    令牌不足时先预定令牌（令牌数允许为负），再按需等待，
+    保证并发调用方按到达顺序排队，只等待配额实际要求的时间。
+
+    Args:
+        rate: 每秒补充的令牌数
+        capacity: 桶容量，即允许的突发请求数
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        预定一个令牌，返回拿到令牌前需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# 同一账号的所有客户端和线程共享同一组令牌桶
+RATE_LIMITERS = {endpoint: TokenBucket(rate, capacity) for endpoint, (rate, capacity) in RATE_LIMITS.items()}
+
+# 响应缓存配置，设置环境变量FOFA_CACHE=0可整体关闭缓存
+CACHE_PATH = os.getenv('FOFA_CACHE_PATH', os.path.join('.cache', 'fofa_cache.sqlite3'))
+CACHE_MAX_ENTRIES = 20000
+CACHE_TTL = {
+    'search': 24 * 3600,
+    'stats': 6 * 3600,
+}
+
+
+def normalize_query(query):
+    """
+    规范化查询语句用于缓存键：去除首尾空白，并合并引号外的连续空白
+    """
+    result = []
+    in_quote = False
+    escaped = False
+    pending_space = False
+    for ch in query.strip():
+        if in_quote:
+            result.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_quote = False
+        elif ch.isspace():
+            pending_space = True
+        else:
+            if pending_space:
+                result.append(' ')
+                pending_space = False
+            result.append(ch)
+            if ch == '"':
+                in_quote = True
+    return ''.join(result)
+
+
+def cache_key(endpoint, query, **parts):
+    """
+    根据接口、规范化后的查询语句和其他参数生成缓存键
+
+    查询语句优先使用语法树的规范形式，条件顺序、括号和空白不同的等价语句共享缓存；
+    无法解析时退回只合并空白的规范化
+    """
+    try:
+        query = canonicalize(query)
+    except QueryError:
+        query = normalize_query(query)
+    return json.dumps([endpoint, query, parts], ensure_ascii=False, sort_keys=True)
+
+
+class FofaClient:
+    """
+    FOFA API客户端，凭据和基础地址只加载一次，并复用keep-alive连接池
+
+    Args:
+        email: FOFA账号邮箱，默认读取环境变量FOFA_EMAIL
+        key: FOFA API Key，默认读取环境变量FOFA_KEY
+        base_url: FOFA API基础地址
+        timeout: 默认请求超时，可在每次调用时覆盖
+        pool_size: 连接池大小
+        cache: search和stats的响应缓存，为None时不缓存
+    """
+
+    def __init__(self, email=None, key=None, base_url=FOFA_BASE_URL,
+                 timeout=DEFAULT_TIMEOUT, pool_size=10, cache=None):
+        self.email = email or os.getenv('FOFA_EMAIL')
+        self.key = key or os.getenv('FOFA_KEY')
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+    def _get(self, path, params=None, timeout=None, stream=False, endpoint=None):
+        """
+        发送GET请求，自动附带凭据；指定endpoint时先按该接口的配额限速
+        """
+        if endpoint in RATE_LIMITERS:
+            RATE_LIMITERS[endpoint].acquire()
+        params = dict(params or {})
+        params['email'] = self.email
+        params['key'] = self.key
+        return self.session.get(
+            self.base_url + path,
+            params=params,
+            timeout=timeout or self.timeout,
+            stream=stream,
+        )
+
+    def _get_json(self, path, params=None, timeout=None, endpoint=None, metric=None):
+        """
+        发送GET请求并解析JSON，失败时返回带error字段的字典
+
+        metric为成本统计中的接口名，默认与endpoint相同；耗时按响应时间统计，不含限速等待
+        """
+        metric = metric or endpoint
+        start = time.monotonic()
+        try:
+            response = self._get(path, params=params, timeout=timeout, endpoint=endpoint)
+        except requests.RequestException as e:
+            record_fofa(metric, time.monotonic() - start, error=True)
+            return {"error": f"Request failed: {str(e)}"}
+
+        seconds = response.elapsed.total_seconds()
+        if response.status_code == 200:
+            result = response.json()
+            record_fofa(metric, seconds, nbytes=len(response.content),
+                        fpoints=result.get('consumed_fpoint', 0) if isinstance(result, dict) else 0)
+            return result
+        else:
+            record_fofa(metric, seconds, nbytes=len(response.content), error=True)
+            return {"error": f"Request failed with status code {response.status_code}"}
+
+    def cache_get(self, endpoint, key, refresh=False):
+        """
+        读取缓存的响应，refresh为True或未启用缓存时返回None
+        """
+        if self.cache is None or refresh:
+            return None
+        cached = self.cache.get(key, ttl=CACHE_TTL.get(endpoint))
+        if cached is not None:
+            record_fofa_cache_hit(endpoint)
+        return cached
+
+    def cache_set(self, key, result):
+        """
+        缓存成功的响应，错误响应不缓存
+        """
+        if self.cache is not None and not result.get('error'):
+            self.cache.set(key, result)
+
+    # 构建Fofa API请求
+    def search(self, query, fields='banner', page=1, size=100, timeout=None, rate_limit=True, refresh=False):
+        key = cache_key('search', query, fields=fields, page=page, size=size)
+        cached = self.cache_get('search', key, refresh)
+        if cached is not None:
+            return cached
+        params = {
+            'qbase64': base64.b64encode(query.encode()).decode(),
+            'fields': fields,
+            'page': page,
+            'size': size,
+        }
+        result = self._get_json("/api/v1/search/all", params, timeout,
+                                endpoint='search' if rate_limit else None, metric='search')
+        self.cache_set(key, result)
+        return result
+
+    # 构建Fofa API统计请求
+    def stats(self, query, fields='product1,product5,category1,category5', timeout=None, rate_limit=True,
+              refresh=False):
+        key = cache_key('stats', query, fields=fields)
+        cached = self.cache_get('stats', key, refresh)
+        if cached is not None:
+            return cached
+        params = {
+            'qbase64': base64.b64encode(query.encode()).decode(),
+            'fields': fields,
+        }
+        result = self._get_json("/api/v1/search/stats", params, timeout,
+                                endpoint='stats' if rate_limit else None, metric='stats')
+        self.cache_set(key, result)
+        return result
+
+    # 构建FOFA API的Host请求
+    def host(self, host, timeout=None):
+        return self._get_json(f"/api/v1/host/{host}", timeout=timeout, endpoint='host')
+
+    # 构建流式查询
+    def stream_response(self, query, fields='host,title,header,product', size=100, timeout=None):
+        """
+        发起流式查询并返回未读取的响应对象，网络异常直接抛出，由调用方负责重试
+        """
+        params = {
+            'qbase64': base64.b64encode(query.encode()).decode(),
+            'fields': fields,
+            'size': size,  # 设置每次请求的结果数量
+        }
+        response = self._get("/api/v1/stream/search/all", params, timeout, stream=True, endpoint='search')
+        record_fofa('stream', response.elapsed.total_seconds(), error=response.status_code != 200)
+        return response
+
+    def stream(self, query, fields='host,title,header,product', size=100, timeout=None):
+        try:
+            response = self.stream_response(query, fields=fields, size=size, timeout=timeout)
+        except requests.RequestException as e:
+            return {"error": f"Request failed: {str(e)}"}
+
+        if response.status_code == 200:
+            return response.iter_lines()
+        else:
+            response.close()
+            return {"error": f"Request failed with status code {response.status_code}"}
+
+    # 查询规则标签
+    def tags(self, value='网络摄像头', field='title', timeout=None):
+        params = {
+            'value': value,
+            'field': field,
+        }
+        return self._get_json("/api/v1/rule_tags/query", params, timeout, endpoint='rule_tags')
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    获取模块共享的FofaClient实例，首次调用时创建
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                cache = None
+                if os.getenv('FOFA_CACHE', '1') != '0':
+                    cache = SQLiteCache(CACHE_PATH, max_entries=CACHE_MAX_ENTRIES)
+                _client = FofaClient(cache=cache)
+    return _client
+
+
+def cache_stats():
+    """
+    返回共享客户端响应缓存的命中统计
+    """
+    cache = get_client().cache
+    if cache is None:
+        return {'enabled': False}
+    return {'enabled': True, **cache.stats()}
+
+
+def fofa_search(query, fields='banner', page=1, size=100, timeout=None, refresh=False):
+    return get_client().search(query, fields=fields, page=page, size=size, timeout=timeout, refresh=refresh)
+
+
+def fofa_stats(query: str, fields: str = 'product1,product5,category1,category5', timeout=None, refresh=False):
+    return get_client().stats(query, fields=fields, timeout=timeout, refresh=refresh)
+
+
+def fofa_host(host, timeout=None):
+    return get_client().host(host, timeout=timeout)
+
+
+def fofa_stream(query, timeout=None):
+    return get_client().stream(query, timeout=timeout)
+
+
+def fofa_tags(timeout=None):
+    return get_client().tags(timeout=timeout)
+
+
+# 异步版本：在事件循环中等待限速令牌，再在线程中复用共享连接池执行请求，并发数由调用方控制
+# 命中缓存时直接返回，不占用限速令牌
+async def async_fofa_search(query, fields='banner', page=1, size=100, timeout=None, refresh=False):
+    client = get_client()
+    cached = client.cache_get('search', cache_key('search', query, fields=fields, page=page, size=size), refresh)
+    if cached is not None:
+        return cached
+    await RATE_LIMITERS['search'].acquire_async()
+    return await asyncio.to_thread(
+        client.search, query, fields=fields, page=page, size=size, timeout=timeout, rate_limit=False, refresh=True
+    )
+
+
+async def async_fofa_stats(query: str, fields: str = 'product1,product5,category1,category5', timeout=None,
+                           refresh=False):
+    client = get_client()
+    cached = client.cache_get('stats', cache_key('stats', query, fields=fields), refresh)
+    if cached is not None:
+        return cached
+    await RATE_LIMITERS['stats'].acquire_async()
+    return await asyncio.to_thread(
+        client.stats, query, fields=fields, timeout=timeout, rate_limit=False, refresh=True
+    )
 
 # 示例查询
 if __name__ == "__main__":
@@ -113,4 +375,4 @@ if __name__ == "__main__":
     #         print(line.decode('utf-8'))  # 解码并打印每一行
 
     # result = fofa_tags()
-    print(json.dumps(result, ensure_ascii=False, indent=2))
\ No newline at end of file
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,250 @@
+"""
+批量规则审核：从CSV/XLSX/JSONL文件中流式读取规则，使用有界线程池并发执行
+重复性检查、厂商信息检查和规则准确性检查，结果按完成顺序输出。
+
+用法:
+    python batch.py rules.xlsx --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from fofa_query import canonicalize, QueryError
+from result_store import DEFAULT_STORE_PATH
+
+# 输入文件的列名别名，兼容英文列名和结果Excel中的中文列名
+COLUMN_ALIASES = {
+    'query': ['query', 'rule', '规则内容', '规则'],
+    'webside': ['webside', 'website', '产品URL', '官网'],
+    'manufacturer': ['manufacturer', '厂商'],
+    'classification1': ['classification1', '大类', '一级分类'],
+    'classification2': ['classification2', '小类', '分类', '二级分类'],
+}
+
+REUSE_LIMIT = 10000  # 批次内保留的已完成结果数，用于复用等价规则的结果
+COST_COLUMNS = ("FOFA请求数", "F点消耗", "下载字节数", "LLM token数")  # 复用结果时清零的成本列
+
+
+def normalize_row(raw):
+    """
+    将输入行按列名别名映射为rule2excel需要的5个字段，缺少规则内容时返回None
+    """
+    row = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        value = next((raw[alias] for alias in aliases if raw.get(alias) not in (None, '')), '')
+        row[name] = str(value).strip()
+    return row if row['query'] else None
+
+
+def iter_raw_rows(path):
+    """
+    按文件类型流式读取原始行，每行为 {列名: 值}
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            yield from csv.DictReader(f)
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else '' for cell in next(rows, [])]
+            for values in rows:
+                yield dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"不支持的输入文件类型: {ext}")
+
+
+def read_rules(path):
+    """
+    流式读取规则文件，跳过没有规则内容的行
+    """
+    for raw in iter_raw_rows(path):
+        row = normalize_row(raw)
+        if row:
+            yield row
+
+
+def count_rules(path):
+    """
+    预先统计规则条数，用于计算进度和预计剩余时间
+    """
+    return sum(1 for _ in read_rules(path))
+
+
+def review_one(row, full_report=False):
+    from main import review_rule
+    return review_rule(row['query'], row['webside'], row['manufacturer'],
+                       row['classification1'], row['classification2'], full_report=full_report)
+
+
+def rule_key(row):
+    """
+    规则的等价键：规则内容取规范形式，条件顺序、括号和空白不同的等价规则键相同
+    """
+    try:
+        query = canonicalize(row['query'])
+    except QueryError:
+        query = row['query'].strip()
+    return (query, row['webside'], row['manufacturer'], row['classification1'], row['classification2'])
+
+
+def reuse_result(result, row, source):
+    """
+    将等价规则的审核结果复制给当前行，结果行中的规则内容保留当前行的原文
+
+    复用的行没有发起任何请求，成本列记为0并注明复用来源，避免汇总成本时重复计算
+    """
+    if result is None:
+        return None
+    reused_row = dict(result['row'], 规则内容=row['query'], 复用自=f"第{source + 1}条")
+    reused_row.update({column: 0 for column in COST_COLUMNS})
+    return dict(result, row=reused_row)
+
+
+def run_batch(path, workers=4, total=None, full_report=False, metrics_path=None):
+    """
+    并发审核规则文件中的所有规则，按完成顺序逐条产出结果
+
+    同时在途的任务数不超过workers的两倍，输入文件不会被一次性读入内存。
+    与已提交规则等价（规范形式和其他字段都相同）的行不再重复审核，直接复用其结果。
+
+    Args:
+        path: CSV/XLSX/JSONL规则文件路径
+        workers: 并发审核的规则数
+        total: 规则总数，为None时预先统计
+        full_report: 是否对每条规则执行全部检查，默认结果确定后跳过剩余检查
+        metrics_path: 成本统计导出文件（.json或Prometheus文本），默认读取环境变量METRICS_PATH
+
+    Yields:
+        (序号, 输入行, 审核结果, 错误信息)
+    """
+    if total is None:
+        total = count_rules(path)
+    rules = enumerate(read_rules(path))
+    max_in_flight = workers * 2
+    start = time.monotonic()
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}  # future -> 等价键
+        rows_by_key = {}  # 等价键 -> 等待该结果的 [(序号, 输入行)]
+        results_by_key = OrderedDict()  # 等价键 -> (审核行序号, 审核结果, 错误信息)，只保留最近的REUSE_LIMIT条
+        ready = deque()
+
+        def submit_next():
+            for index, row in rules:
+                key = rule_key(row)
+                if key in results_by_key:
+                    print(f"第{index + 1}条规则与已审核规则等价，复用结果: {row['query']}")
+                    ready.append((index, row, *results_by_key[key]))
+                elif key in rows_by_key:
+                    print(f"第{index + 1}条规则与审核中的规则等价，等待复用结果: {row['query']}")
+                    rows_by_key[key].append((index, row))
+                else:
+                    rows_by_key[key] = [(index, row)]
+                    in_flight[executor.submit(review_one, row, full_report)] = key
+                    return True
+            return False
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while in_flight or ready:
+            if not ready:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = in_flight.pop(future)
+                    try:
+                        outcome = (future.result(), None)
+                    except Exception as e:
+                        outcome = (None, str(e))
+                    waiting = rows_by_key.pop(key)
+                    outcome = (waiting[0][0], *outcome)
+                    results_by_key[key] = outcome
+                    if len(results_by_key) > REUSE_LIMIT:
+                        results_by_key.popitem(last=False)
+                    ready.extend((index, row, *outcome) for index, row in waiting)
+                    submit_next()
+
+            index, row, source, result, error = ready.popleft()
+            done += 1
+            elapsed = time.monotonic() - start
+            rate = done / elapsed if elapsed else 0.0
+            eta = (total - done) / rate if rate else 0.0
+            print(f"[批量审核] {done}/{total} 完成, 吞吐 {rate * 60:.1f} 条/分钟, 预计剩余 {eta:.0f} 秒")
+            if index != source:
+                result = reuse_result(result, row, source)
+            yield index, row, result, error
+
+    elapsed = time.monotonic() - start
+    print(f"[批量审核] 全部完成: {done} 条规则, 用时 {elapsed:.1f} 秒, "
+          f"平均 {elapsed / done if done else 0:.1f} 秒/条")
+
+    from llm_cache import cache_report
+    report = cache_report()
+    print(f"[批量审核] LLM缓存命中率 {report['hit_rate']:.0%}, "
+          f"节省LLM耗时 {report['seconds_saved']:.1f} 秒, 节省token {report['tokens_saved']}")
+
+    from metrics import GLOBAL, format_summary, write_metrics
+    print(f"[批量审核] 成本统计:\n{format_summary(GLOBAL.summary())}")
+    write_metrics(metrics_path)
+
+
+def add_arguments(parser):
+    parser.add_argument('input', help="CSV/XLSX/JSONL规则文件")
+    parser.add_argument('--workers', type=int, default=4, help="并发审核的规则数")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="结果JSONL存储文件")
+    parser.add_argument('--output', default="rule_check_result.xlsx", help="导出的结果文件(xlsx/csv/parquet)")
+    parser.add_argument('--full-report', action='store_true', help="执行全部检查，不在结果确定后跳过剩余检查")
+    parser.add_argument('--metrics', default=None, help="成本统计导出文件，.json为JSON格式，其他为Prometheus文本格式")
+
+
+def review_file(input, workers=4, store=DEFAULT_STORE_PATH, output="rule_check_result.xlsx", full_report=False,
+                metrics=None):
+    """
+    批量审核规则文件，逐条写入结果存储，全部完成后导出结果文件
+    """
+    from main import get_result_store
+
+    store = get_result_store(store, legacy_excel=output)
+    for index, row, result, error in run_batch(input, workers=workers, full_report=full_report, metrics_path=metrics):
+        if error:
+            print(f"第{index + 1}条规则审核失败: {row['query']} -> {error}")
+            store.append({
+                "分类": row['classification2'],
+                "产品URL": row['webside'],
+                "厂商": row['manufacturer'],
+                "规则内容": row['query'],
+                "是否录入": False,
+                "原因": f"审核失败: {error}",
+            })
+        else:
+            print(f"第{index + 1}条规则审核完成: {row['query']} -> 是否录入: {result['main_true']}")
+            store.append(result['row'])
+
+    store.export(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量审核FOFA规则")
+    add_arguments(parser)
+    args = parser.parse_args()
+    review_file(args.input, workers=args.workers, store=args.store, output=args.output,
+                full_report=args.full_report, metrics=args.metrics)
+
+
+if __name__ == "__main__":
+    main()
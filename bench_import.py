@@ -0,0 +1,76 @@
+"""
+导入耗时基准：检查命令行入口和查重路径不会提前导入重量级依赖，
+并在子进程中测量冷启动导入耗时，超出阈值时以非零状态退出，用于防止回归。
+
+用法:
+    python bench_import.py
+    python bench_import.py --repeat 10 --max-seconds 1.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 这些模块只允许在需要LLM或表格导出的子命令中导入
+HEAVY_MODULES = ('langchain', 'langchain_openai', 'langchain_community', 'openai', 'pandas', 'numpy', 'bs4')
+
+# (说明, 导入语句)
+TARGETS = [
+    ("命令行入口", "import cli"),
+    ("查重子命令", "import cli, main, duplicate_check_demo"),
+]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def heavy_modules_loaded(statement):
+    """
+    在子进程中执行导入语句，返回被导入的重量级模块
+    """
+    code = (
+        f"import sys; {statement}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [name for name in output.stdout.strip().split(',') if name]
+
+
+def measure(statement, repeat):
+    """
+    测量子进程冷启动执行导入语句的耗时（扣除空解释器启动时间），返回中位数
+    """
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True)
+        return time.perf_counter() - start
+
+    baseline = statistics.median(run("pass") for _ in range(repeat))
+    return statistics.median(run(statement) for _ in range(repeat)) - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时基准")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=1.0, help="单个目标允许的最大导入耗时")
+    args = parser.parse_args()
+
+    failed = False
+    for name, statement in TARGETS:
+        heavy = heavy_modules_loaded(statement)
+        seconds = measure(statement, args.repeat)
+        status = "OK"
+        if heavy:
+            status = f"FAIL: 提前导入了 {', '.join(heavy)}"
+            failed = True
+        elif seconds > args.max_seconds:
+            status = f"FAIL: 超过阈值 {args.max_seconds:.2f}s"
+            failed = True
+        print(f"{name:<10} {seconds * 1000:8.1f} ms  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ACCESS_RESOLUTION = 60  # 命中时最近访问时间早于该秒数才更新，避免每次读取都写盘
+EVICT_EVERY = 100  # 每写入多少条检查一次容量
+
+
+class SQLiteCache:
+    """
+    基于SQLite的持久化键值缓存，支持TTL过期和按最近访问时间的LRU淘汰
+
+    值以JSON形式存储，同一个缓存文件可被多个线程和进程共享。
+    最近访问时间按ACCESS_RESOLUTION秒的粒度记录，容量每EVICT_EVERY次写入检查一次，
+    条目数可能短暂超出max_entries。
+
+    Args:
+        path: SQLite文件路径
+        max_entries: 最大条目数，超出后淘汰最久未访问的条目
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed)")
+        self.conn.commit()
+
+    def get(self, key, ttl=None):
+        """
+        读取缓存，不存在或超过ttl秒时返回None
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created, accessed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                if row is not None:
+                    self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            if now - row[2] > ACCESS_RESOLUTION:
+                self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        写入缓存，每EVICT_EVERY次写入检查一次容量，超出时淘汰最久未访问的条目
+        """
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            self._writes += 1
+            if self._writes >= EVICT_EVERY:
+                self._writes = 0
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        size = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if size > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (size - self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+
+    def stats(self):
+        """
+        返回命中次数、未命中次数、命中率和当前条目数
+        """
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,42 +1,48 @@
-import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 import requests
 import base64
 import json
+import asyncio
+
+from config import load_environment
+from crawler import get_crawler
+from evidence import RuleEvidence
+from llm import get_llm, get_chain
+from llm_cache import cached_run
+from html_features import html_to_features
+from prompt_packer import count_tokens, pack_items, pack_text
+from taxonomy import validate_pair, candidate_taxonomy
+
+BODY_FEATURE_CHARS = 3000  # 每条FOFA body特征的最大字符数
+WEBSITE_FEATURE_CHARS = 8000  # 爬取网页特征的最大字符数
+
+# check_webside_manufacturer各输入槽位的token预算
+WEBSITE_PROMPT_BUDGET = {
+    'content': 6000,
+    'web_html': 4000,
+}
+
+async def _first_pages(evidence):
+    return await asyncio.gather(
+        evidence.pages_async('service', [1]),
+        evidence.pages_async('web', [1]),
+    )
 
-from API import fofa_search
-
-def load_environment():
-    """加载环境变量"""
-    load_dotenv()
-    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "")
-    os.environ['SERPAPI_API_KEY'] = os.getenv("SERPAPI_API_KEY", "")
-    
-    # 检查关键环境变量
-    if not os.environ["SERPAPI_API_KEY"]:
-        print("警告: SERPAPI_API_KEY 未设置")
-    if not os.environ["OPENAI_API_KEY"]:
-        print("警告: OPENAI_API_KEY 未设置")
-  
-def get_banner_or_body(query):
+def get_banner_or_body(query, evidence=None):
     """
     根据规则查询FOFA，获取banner或title信息
+
+    evidence为共享的RuleEvidence时，直接复用其中已获取的第1页结果
     """
     print(f"=============开始获取banner和body信息================")
-    banner_query = '(' + query + ') && type="service"'
-    body_query = '(' + query + ') && type!="service"'
-    banner_result = fofa_search(banner_query, fields='banner')
-    body_result = fofa_search(body_query, fields='body')
-    if banner_result.get('error') and body_result.get('error'):
-        print(f"FOFA查询失败: {banner_result.get('error', '')} {body_result.get('error', '')}")
+    evidence = evidence or RuleEvidence(query)
+    (banner_page,), (body_page,) = asyncio.run(_first_pages(evidence))
+    if banner_page['error'] and body_page['error']:
+        print(f"FOFA查询失败: {banner_page['error']} {body_page['error']}")
         return []
     
     # 若result内容不为空
-    body_result = body_result.get('results', [])[:3]
-    banner_result = banner_result.get('results', [])[:5]
+    body_result = body_page['body'][:3]
+    banner_result = banner_page['banner'][:5]
 
     # 简化body的内容
     # body_result = simplify_content(body_result)
@@ -51,10 +57,7 @@ def get_banner_or_body(query):
     if body_result:
         content.append("查询到的Body信息:")
         for item in body_result:
-            if len(item) > 20000:
-                content.append(f"Body: {item[:10000]}...{item[-10000:]}")
-            else:
-                content.append(f"Body: {item}")
+            content.append(f"Body: {html_to_features(item, budget=BODY_FEATURE_CHARS)}")
 
     content.append(f"查询规则: {query}")
     return content
@@ -64,27 +67,41 @@ def crawl_website(url):
     爬取指定网站HTML内容
     """
     print(f"============开始爬取网站 {url} 的html内容================")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0'
-    }
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        text = get_crawler().fetch(url)
 
-        # 调用简化内容函数
-        # response = simplify_content(response.text)
-        
-        # 截断内容以避免过长
-        if len(response.text) > 80000:
-            print(f"警告: 爬取的内容过长 ({len(response.text)} 字符)")
-            return response.text[:25000] + response.text[-25000:]  # 截取前后各30000字符，中间部分省略
-        else:
-            return response.text
+        # 只保留网页的关键特征，避免大量CSS/JS进入提示词
+        return html_to_features(text, budget=WEBSITE_FEATURE_CHARS)
     except requests.RequestException as e:
         print(f"爬取网站失败: {str(e)}")
         return None
 
+def pack_reference(content, budget):
+    """
+    按段落打包get_banner_or_body返回的参考信息
+
+    Banner和Body条目各自合并近似重复并按原始大小分配预算，
+    段落标题和查询规则保持原来的顺序和位置
+    """
+    sections = []  # [(标题行, 条目列表)]
+    for line in content:
+        if line.startswith(('Banner: ', 'Body: ')) and sections:
+            sections[-1][1].append(line)
+        else:
+            sections.append((line, []))
+
+    item_budget = max(budget - sum(count_tokens(heading) for heading, _ in sections), 0)
+    sizes = [sum(count_tokens(item) for item in items) for _, items in sections]
+    total_size = sum(sizes) or 1
+
+    lines = []
+    for (heading, items), size in zip(sections, sizes):
+        lines.append(heading)
+        if items:
+            packed, _ = pack_items(items, item_budget * size // total_size, label=heading.rstrip(':'))
+            lines.append(packed)
+    return '\n'.join(lines)
+
 def check_webside_manufacturer(llm, content, webside, manufacturer):
     """
     使用LLM检查网站和厂商信息
@@ -114,14 +131,13 @@ def check_webside_manufacturer(llm, content, webside, manufacturer):
     web_html = crawl_website(webside)
     print(f"爬取网站 {webside} 的HTML内容完毕\n")
 
-    prompt = PromptTemplate(
-        input_variables=["content", "webside", "web_html", "manufacturer"],
-        template=template
-    )
-    
+    # 按token预算打包参考信息和网站内容
+    content = pack_reference(content, WEBSITE_PROMPT_BUDGET['content'])
+    web_html = pack_text(web_html, WEBSITE_PROMPT_BUDGET['web_html'], label='网站内容')
+
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        return chain.run(content=content, webside=webside, web_html=web_html, manufacturer=manufacturer)
+        chain = get_chain('check_webside_manufacturer', template, ["content", "webside", "web_html", "manufacturer"], llm)
+        return cached_run(chain, content=content, webside=webside, web_html=web_html, manufacturer=manufacturer)
     except Exception as e:
         error_msg = f"检查厂商信息失败: {str(e)}"
         print(error_msg)
@@ -132,43 +148,39 @@ def check_classification(llm, content, classification1, classification2):
     基于参考信息，判断分类是否准确
     """
     print("\n\n================开始检查分类信息准确性===============")
-    # 可选的分类结果
-    classification = {}
-    f = open('classification.json', 'r', encoding='utf-8')
-    try:
-        classification = json.load(f)
-        print("加载所有分类信息成功")
-    except json.JSONDecodeError as e:
-        print(f"加载所有分类信息失败: {str(e)}")
+    # 小类不在大类下时无需调用LLM，直接判定分类不准确
+    valid, reason = validate_pair(classification1, classification2)
+    if not valid:
+        result = f"分类不准确。理由: {reason}"
+        print(result)
+        return result
+
+    # 只提供与给定分类相关的候选分类
+    classification = candidate_taxonomy(classification1, classification2)
 
     template = """
     你是一个优秀的网络信息分类专家，你需要根据以下内容判断分类是否准确，先判断大类再判断小类。
 
     参考信息: {content}
 
-    所有分类信息：{classification}
+    候选分类信息：{classification}
     请判断以下两个分类是否准确：
 
     大类: {classification1}
     小类: {classification2}
 
-    请结合你的专业知识和行业常识，结合给定的所有分类信息，判断这两个分类是否准确，并给出理由。
-    - 首先思考参考信息的内容和特点，结合所有分类信息，思考最可能的一级分类名称，判断是否属于大类的内容
-    - 然后类似的，结合所有分类信息，进一步判断是否属于小类的内容
+    请结合你的专业知识和行业常识，结合给定的候选分类信息，判断这两个分类是否准确，并给出理由。
+    - 首先思考参考信息的内容和特点，结合候选分类信息，判断是否属于大类的内容
+    - 然后类似的，结合候选分类信息，进一步判断是否属于小类的内容
 
     注意：小类必须在对应的大类下面，所以你主要关注小类划分与参考信息是否一致。
     若参考信息为空，返回不确定
 
     """
 
-    prompt = PromptTemplate(
-        input_variables=["content", "classification", "classification1", "classification2"],
-        template=template
-    )
-
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        return chain.run(content=content, classification=classification, classification1=classification1, classification2=classification2)
+        chain = get_chain('check_classification', template, ["content", "classification", "classification1", "classification2"], llm)
+        return cached_run(chain, content=content, classification=classification, classification1=classification1, classification2=classification2)
     except Exception as e:
         error_msg = f"检查分类信息失败: {str(e)}"
         print(error_msg)
@@ -207,20 +219,15 @@ def summarize_content(llm, content):
     4. 确保JSON格式正确，没有多余的逗号或缺少的括号
     """
 
-    prompt = PromptTemplate(
-        input_variables=["content"],
-        template=template
-    )
-
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
+        chain = get_chain('summarize_content', template, ["content"], llm)
         if not content:
             return {"error": "内容为空，无法进行总结", 
                    "website_check": {"result": False, "reason": "内容为空"},
                    "manufacturer_check": {"result": False, "reason": "内容为空"},
                    "classification_check": {"result": False, "reason": "内容为空"}}
         
-        result = chain.run(content=content)
+        result = cached_run(chain, content=content)
         
         if not result:
             return {"error": "总结内容为空，无法进行格式化输出",
@@ -270,17 +277,29 @@ def summarize_content(llm, content):
             "classification_check": {"result": False, "reason": "处理失败"}
         }
 
-def check(query, webside, manufacturer, classification1, classification2):
+def check(query, webside, manufacturer, classification1, classification2, evidence=None, full_report=False):
+    """
+    检查厂商、官网和分类信息
+
+    大类和小类的组合不在分类体系中时直接判定分类不准确；非完整报告模式下
+    不再查询FOFA、爬取官网和调用LLM，网站和厂商检查记为跳过。
+    """
+    valid, reason = validate_pair(classification1, classification2)
+    if not valid and not full_report:
+        print(f"分类不准确，跳过厂商和网站检查: {reason}")
+        skipped = {"result": None, "reason": "已跳过: 分类组合无效", "skipped": True}
+        return {
+            "website_check": dict(skipped),
+            "manufacturer_check": dict(skipped),
+            "classification_check": {"result": False, "reason": reason},
+        }
+
     load_environment()
     
-    # 初始化LLM
-    llm = ChatOpenAI(
-        model="qwen",
-        openai_api_base="http://211.91.254.226:2440/v1",
-        verbose=False,
-    )
+    # 获取共享的LLM客户端
+    llm = get_llm()
 
-    content = get_banner_or_body(query)
+    content = get_banner_or_body(query, evidence=evidence)
     print("banner和body内容查询完毕\n")
 
     res = check_webside_manufacturer(
@@ -304,6 +323,9 @@ def check(query, webside, manufacturer, classification1, classification2):
     # 将结果合并并格式化为JSON
     content = res + "\n" + res2
     res_json = summarize_content(llm, content)
+    # 本地校验的结论不交给LLM改写
+    if not valid:
+        res_json['classification_check'] = {"result": False, "reason": reason}
 
     return res_json
 
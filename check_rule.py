@@ -14,96 +14,69 @@ B 若查询结果远大于5页, 采用随机抽样法:
 思路：
 1. 使用Fofa API进行查询, 获取资产总数
 2. 若结果小于50, 检索所有IP地址的body
-3. 若结果大于50, 对所有页面, 随机采取6页, 共60个IP
+3. 若结果大于50, 将第2页到最后一页分层, 每层随机取1页, 连同第1页最多6页、60个IP;
+   分轮请求, 样本中最多同类内容占比的置信区间明确高于或低于0.7时提前停止
 4. 对于服务，一次查询所有60条的内容
 5. 对于网站，一次查询3条，依次判断
 """
+import asyncio
+import os
 import random
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 import json
 
-from API import fofa_search
-from check_info import load_environment
+from evidence import RuleEvidence
+from fofa_query import canonicalize, QueryError
+from llm import get_llm, get_chain
+from llm_cache import cached_run, cached_batch
+from header_cluster import cluster_headers
+from html_features import html_to_features
+from prompt_packer import pack_items
+from sampler import AdaptiveSampler
+from config import load_environment
 
-def simplify_content_list(llm, header_list):
+FETCH_CONCURRENCY = 6  # 单条规则同时进行的FOFA请求数上限
+HEADER_MAX_GROUPS = 5  # 响应头相似度分组的最大组数
+SUMMARY_CONCURRENCY = 4  # body总结同时在途的LLM请求数上限
+SUMMARY_FALLBACK_CHARS = 5000  # 总结失败时保留的原始内容长度
+BODY_FEATURE_CHARS = 4000  # 每条body特征的最大字符数
+
+# check_content各输入槽位的token预算
+CONTENT_PROMPT_BUDGET = {
+    'banner_content': 8000,
+    'body_content': 12000,
+}
+
+# 分轮抽样参数：(结果数小于该值时全取, 最多抽取页数, 每轮页数)
+SAMPLE_PLAN = {
+    'service': (50, 6, 2),
+    'web': (20, 3, 1),
+}
+
+# 抽样种子取该值时每次随机选页，用于需要不同样本的复查
+RANDOM_SEED = 'random'
+
+def simplify_content_list(header_list, max_groups=HEADER_MAX_GROUPS):
     """
-    使用LLM对header_list进行相似度检测，记录相似的索引
+    对header_list进行本地相似度聚类，记录相似的索引
     返回相似header的组，每组包含相似header的索引列表
     """
     if not header_list:
         return []
-    
-    # 使用LLM进行相似度分析
-    template = """
-    你是一个HTTP响应头分析专家。我会给你一个包含多个HTTP响应头的列表，你需要分析它们的相似性并将它们分组。
-    
-    HTTP响应头列表:
-    {headers}
-    
-    请分析这些响应头，并将相似的响应头分组。两个响应头相似意味着它们很可能来自相同或非常相似的web服务器配置。
-    
-    分析以下内容来判断相似性:
-    1. Server字段
-    2. Content-Type字段
-    3. X-Powered-By字段
-    4. Set-Cookie模式
-    5. 其他关键HTTP头部信息
-    
-    以JSON格式返回分组结果，每个组是一个包含索引的数组（索引从0开始）。
-    例如: [[0, 2, 5], [1, 4], [3, 6, 7]]
-    这表示响应头0、2、5相似，1和4相似，3、6、7相似。
-    
-    注意:
-    - 判断尽可能宽松，只要有明显的相似特征即可，类别控制在五组以内且必须包含所有索引
-    - 如果某个响应头与其他响应头都不相似，它应该单独一组
-    - 只关注响应头的内容，不考虑其他因素
-    - 请只返回JSON格式的分组结果，不要添加任何额外解释
-    """
-    
-    try:
-        # 准备传递给LLM的header数据
-        headers_text = ""
-        for i, header in enumerate(header_list):
-            headers_text += f"===== 响应头 {i} =====\n{header}\n\n"
-        
-        # 创建提示并执行
-        prompt = PromptTemplate(
-            input_variables=["headers"],
-            template=template
-        )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.run(headers=headers_text)
-        
-        # 解析JSON结果
-        # 去除可能的前后缀文本，只保留JSON部分
-        result = result.strip()
-        if not result.startswith('['):
-            result = result[result.find('['):]
-        if not result.endswith(']'):
-            result = result[:result.rfind(']')+1]
-            
-        similarity_groups = json.loads(result)
-        print(f"LLM分析的响应头相似度分组: {similarity_groups}")
-        
-        return similarity_groups
-    except Exception as e:
-        print(f"分析响应头相似度时出错: {str(e)}")
-        # 如果LLM分析失败，退回到简单分组（每个header单独一组）
-        return [[i] for i in range(len(header_list))]
-    
 
-def summarize_body_content(llm, body_content_list, header_content_list):
+    similarity_groups = cluster_headers(header_list, max_groups=max_groups)
+    print(f"响应头相似度分组: {similarity_groups}")
+    return similarity_groups
+
+def summarize_body_content(llm, body_content_list, header_content_list, max_concurrency=SUMMARY_CONCURRENCY):
     """
     对body的内容进行llm总结，保留主要特征信息。
-    使用header相似度分组来减少重复分析。
+    使用header相似度分组来减少重复分析，各组代表内容并发总结。
     """
     if not body_content_list or not header_content_list:
         return []
     
     # 获取相似header的分组
-    similarity_groups = simplify_content_list(llm, header_content_list)
+    similarity_groups = simplify_content_list(header_content_list)
     
     template = """
     你是一个优秀的内容总结员, 你的任务是对以下body内容进行总结，保留主要特征信息。
@@ -118,106 +91,138 @@ def summarize_body_content(llm, body_content_list, header_content_list):
     - 网站的类别信息
     """
 
-    prompt = PromptTemplate(
-        input_variables=["body_content"],
-        template=template
+    chain = get_chain('summarize_body_content', template, ["body_content"], llm)
+    results = body_content_list.copy()  # 创建结果列表的副本
+
+    # 每组相似header只总结第一个，不在任何组中的内容单独总结
+    representatives = []
+    grouped = set()
+    for group in similarity_groups:
+        if group and group[0] not in grouped:
+            representatives.append(group[0])
+            grouped.update(group)
+    representatives += [i for i in range(len(body_content_list)) if i not in grouped]
+
+    # 并发批量总结，单条失败时退回截断后的原始内容
+    summaries = cached_batch(
+        chain,
+        [{"body_content": body_content_list[i]} for i in representatives],
+        max_concurrency=max_concurrency,
     )
+    summary_of = {}
+    for idx, summary in zip(representatives, summaries):
+        if isinstance(summary, Exception) or not summary:
+            print(f"第{idx+1}条body内容总结失败，使用截断后的原始内容: {summary}")
+            summary = body_content_list[idx][:SUMMARY_FALLBACK_CHARS]
+        else:
+            print(f"完成第{idx+1}条body内容的总结")
+        results[idx] = summary
+        summary_of[idx] = summary
+
+    # 将结果复制到组内其他索引
+    for group in similarity_groups:
+        if group and group[0] in summary_of:
+            for other_idx in group[1:]:
+                results[other_idx] = summary_of[group[0]]
+                print(f"复用第{group[0]+1}条结果到第{other_idx+1}条 (相似header)")
+
+    return results
+
+def _sample_groups(kind, pages):
+    """
+    对累计样本做本地指纹分组，作为最多同类内容占比的估计依据
+    """
+    field = 'banner' if kind == 'service' else 'header'
+    items = [item for page in pages for item in page.get(field, [])]
+    return cluster_headers(items, max_groups=None)
 
-    try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        results = body_content_list.copy()  # 创建结果列表的副本
-        
-        processed_indices = set()  # 跟踪已处理的索引
-        
-        # 对每组相似的header，只处理第一个
-        for group in similarity_groups:
-            if not group:
-                continue
-                
-            # 处理每组的第一个元素
-            first_idx = group[0]
-            if first_idx not in processed_indices:
-                result = chain.run(body_content=body_content_list[first_idx])
-                results[first_idx] = result
-                processed_indices.add(first_idx)
-                print(f"完成第{first_idx+1}条body内容的总结")
-                
-                # 将结果复制到组内其他索引
-                for other_idx in group[1:]:
-                    results[other_idx] = result
-                    processed_indices.add(other_idx)
-                    print(f"复用第{first_idx+1}条结果到第{other_idx+1}条 (相似header)")
-        
-        # 处理剩余未处理的内容（不在任何相似组中的）
-        for i in range(len(body_content_list)):
-            if i not in processed_indices:
-                result = chain.run(body_content=body_content_list[i])
-                results[i] = result
-                print(f"完成第{i+1}条body内容的总结")
-        
-        return results
-    except Exception as e:
-        return {"error": str(e)}
 
-def get_content(query):
+async def _sample_kind(evidence, kind, probe, semaphore, rng):
     """
-    获取Fofa API的查询结果
+    从探测页开始分轮抽样，区间判定完成或页数用尽时停止，返回所有已获取的页
     """
-    banner_query = '(' + query + ') && type="service"'
-    body_query = '(' + query + ') && type!="service"'
+    if probe['error']:
+        return [], None
+    full_below, max_pages, pages_per_round = SAMPLE_PLAN[kind]
+    sampler = AdaptiveSampler(probe['size'], max_pages, pages_per_round=pages_per_round,
+                              page_size=evidence.page_size, full_below=full_below, rng=rng)
+    pages = [probe]
+    if sampler.exhaustive and probe['size'] > evidence.page_size:
+        # 结果较少时用一次请求取回全部结果，代替探测页参与统计
+        pages = await evidence.pages_async(kind, [1], semaphore, size=probe['size'])
+    sampler.update(_sample_groups(kind, pages))
+    while True:
+        numbers = sampler.next_pages()
+        if not numbers:
+            break
+        pages.extend(await evidence.pages_async(kind, numbers, semaphore))
+        sampler.update(_sample_groups(kind, pages))
+    return pages, sampler.report()
+
+
+async def get_content_async(query, concurrency=FETCH_CONCURRENCY, evidence=None, seed=None):
+    """
+    并发获取Fofa API的查询结果
+
+    banner单独查询，body和header在同一次请求中获取，保证两者逐条对应；
+    探测用的第1页同时作为抽样的一部分，不再重复请求。
+    结果少于SAMPLE_PLAN中的全量阈值时，探测后用一次请求取回全部结果；
+    结果较多时分层选页、分轮抽样，样本中最多同类内容占比的置信区间
+    明确高于或低于0.7时提前停止。
+
+    Args:
+        query: FOFA查询语句
+        concurrency: 同时进行的FOFA请求数上限
+        evidence: 共享的RuleEvidence，为None时新建
+        seed: 抽样随机种子，默认读取环境变量SAMPLE_SEED；均未设置时由规则的规范形式决定，
+            同一规则重新审核时抽到相同的页，FOFA和LLM缓存可以命中。传入"random"时不固定种子
+    """
+    evidence = evidence or RuleEvidence(query)
+    semaphore = asyncio.Semaphore(concurrency)
+    seed = seed if seed is not None else os.getenv('SAMPLE_SEED', '')
+    try:
+        rule_key = canonicalize(query)
+    except QueryError:
+        rule_key = query.strip()
+
+    def make_rng(kind):
+        if seed == RANDOM_SEED:
+            return random.Random()
+        return random.Random(f"{seed}:{rule_key}:{kind}")
+
     print("开始执行FOFA查询探测")
-    banner_result = fofa_search(banner_query, fields='banner', page=1, size=10)
-    body_result = fofa_search(body_query, fields='body', page=1, size=10)
-    header_result = fofa_search(query, fields='header', page=1, size=10)
+    (banner_probe,), (body_probe,) = await asyncio.gather(
+        evidence.pages_async('service', [1], semaphore),
+        evidence.pages_async('web', [1], semaphore),
+    )
     print("FOFA查询探测完成")
 
-    print("==============开始查询banner内容==============")
-    # 针对banner查询结果进行处理
-    if not banner_result['error']:
-        banner_size = banner_result.get('size', 0)
-        if banner_size < 50:
-            # 获取所有IP地址的banner内容
-            banner_result = fofa_search(banner_query, fields='banner', page=1, size=banner_size)
-            banner_content = [item for item in banner_result.get('results', [])]
-        else:
-            # 随机抽样6页，每页10条，共60条
-            banner_content = []
-            page_numbers = random.sample(range(1, (banner_size // 10) + 2), 6)
-            for page in page_numbers:
-                page_result = fofa_search(banner_query, fields='banner', page=page, size=10)
-                banner_content.extend([item for item in page_result.get('results', [])])
-    print(f"banner内容如下: \n {banner_content}")
-    
+    print("==============开始查询banner、body和header内容==============")
+    (banner_results, banner_report), (body_results, body_report) = await asyncio.gather(
+        _sample_kind(evidence, 'service', banner_probe, semaphore, make_rng('service')),
+        _sample_kind(evidence, 'web', body_probe, semaphore, make_rng('web')),
+    )
+    print(f"banner抽样: {banner_report}")
+    print(f"body抽样: {body_report}")
 
-    print("==============开始查询body和header内容==============")
-    # 针对body查询结果进行处理
-    if not body_result['error']:
-        body_size = body_result.get('size', 0)
-        if body_size < 20:
-            # 获取所有IP地址的body内容
-            body_result = fofa_search(body_query, fields='body', page=1, size=body_size)
-            header_result = fofa_search(query, fields='header', page=1, size=body_size)
-            body_content = [item for item in body_result.get('results', [])]
-            header_content = [item for item in header_result.get('results', [])]
-        else:
-            # 随机抽样3页，每页10条，共30条
-            body_content = []
-            header_content = []
-            page_numbers = random.sample(range(1, (body_size // 10) + 2), 3)
-            for page in page_numbers:
-                page_result = fofa_search(body_query, fields='body', page=page, size=10)
-                header_page_result = fofa_search(query, fields='header', page=page, size=10)
-                # body_content.extend([item for item in page_result.get('results', [])])
-                for item in page_result.get('results', []):
-                    if len(item) < 50000:
-                        body_content.append(item)
-                    else:
-                        body_content.append(item[:25000] + '\n...\n' +item[-25000:])
-                for item in header_page_result.get('results', []):
-                    header_content.append(item)
+    banner_content = []
+    for page in banner_results:
+        banner_content.extend(page['banner'])
+    body_content = []
+    header_content = []
+    for page in body_results:
+        body_content.extend(html_to_features(item, budget=BODY_FEATURE_CHARS) for item in page['body'])
+        header_content.extend(page['header'])
+    print(f"banner内容如下: \n {banner_content}")
     print("==============body内容查询完成==============")
     return banner_content, body_content, header_content
 
+def get_content(query, concurrency=FETCH_CONCURRENCY, evidence=None, seed=None):
+    """
+    获取Fofa API的查询结果，同步入口，内部驱动异步并发抓取
+    """
+    return asyncio.run(get_content_async(query, concurrency=concurrency, evidence=evidence, seed=seed))
+
 def check_content(llm, banner_content, body_content):
     print("==============开始对banner和body内容进行检测============")
     template = """
@@ -225,6 +230,9 @@ def check_content(llm, banner_content, body_content):
     banner_content协议内容列表: {banner_content}
     body_content网站body内容列表: {body_content}
 
+    列表中每行是一条内容，相同或高度相似的内容已合并为一行，行首的[×k]表示该内容出现了k次，统计比例时按出现次数计算。
+    若列表末尾有“[另有N条内容未列出…]”说明行，这N条内容不属于已列出的任何一类，计算比例时分母必须使用说明中的总数。
+
     首先，你需要依次分析所有的协议内容，得到最多的同一类型协议占总协议的个数比例。
     其次，你需要依次分析所有的body内容，得到最多的同一类型网站占总body的个数比例。
     最后，你需要判断所有的banner+body内容，得到最多的同一类型内容占总内容的个数比例。
@@ -239,21 +247,25 @@ def check_content(llm, banner_content, body_content):
     }}
     """
 
-    prompt = PromptTemplate(
-        input_variables=["banner_content", "body_content"],
-        template=template
-    )
+    # 按token预算打包banner和body，合并近似重复的内容
+    banner_text, _ = pack_items(banner_content, CONTENT_PROMPT_BUDGET['banner_content'], label='banner')
+    body_text, _ = pack_items(body_content, CONTENT_PROMPT_BUDGET['body_content'], label='body')
 
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.run(banner_content=banner_content, body_content=body_content)
+        chain = get_chain('check_content', template, ["banner_content", "body_content"], llm)
+        result = cached_run(chain, banner_content=banner_text, body_content=body_text)
         return result
     except Exception as e:
         return {"error": str(e)}
 
-def return_res_reason(res):
+def return_res_reason(res, banner_count=60, body_count=30):
     """
     根据检测结果的比例, 返回最终的结果和理由
+
+    Args:
+        res: check_content的检测结果
+        banner_count: 实际抽样的banner条数
+        body_count: 实际抽样的body条数
     """
     # 处理可能包含markdown格式的JSON字符串
     if isinstance(res, str):
@@ -283,31 +295,27 @@ def return_res_reason(res):
     if banner_ratio < 0.7 and body_ratio < 0.7:
         return {
             "result": False,
-            "reason": f"规则不正确, 随机抽样60条banner, 最高的同一类型比例: {banner_ratio:.2f}, 随机抽样30条body, 最高的同一类型比例: {body_ratio:.2f}, 总比例: {total_ratio:.2f}。"
+            "reason": f"规则不正确, 随机抽样{banner_count}条banner, 最高的同一类型比例: {banner_ratio:.2f}, 随机抽样{body_count}条body, 最高的同一类型比例: {body_ratio:.2f}, 总比例: {total_ratio:.2f}。"
         }
     else:
         return {
             "result": True,
-            "reason": f"规则正确, 随机抽样60条banner, 最高的同一类型比例: {banner_ratio:.2f}, 随机抽样30条body, 最高的同一类型比例: {body_ratio:.2f}, 总比例: {total_ratio:.2f}。"
+            "reason": f"规则正确, 随机抽样{banner_count}条banner, 最高的同一类型比例: {banner_ratio:.2f}, 随机抽样{body_count}条body, 最高的同一类型比例: {body_ratio:.2f}, 总比例: {total_ratio:.2f}。"
         }
 
-def rule(query):
-    banner_content, body_content, header_content = get_content(query)
+def rule(query, evidence=None):
+    banner_content, body_content, header_content = get_content(query, evidence=evidence)
     load_environment()
     
-    # 初始化LLM
-    llm = ChatOpenAI(
-        model="qwen",
-        openai_api_base="http://211.91.254.226:2440/v1",
-        verbose=True,
-    )
+    # 获取共享的LLM客户端
+    llm = get_llm()
 
     print("开始对body内容进行总结")
     simple_body_content = summarize_body_content(llm, body_content, header_content)
     print("body内容总结完成")
     res = check_content(llm, banner_content, simple_body_content)
     print("内容检测完成")
-    res_reason = return_res_reason(res)
+    res_reason = return_res_reason(res, banner_count=len(banner_content), body_count=len(body_content))
     return res_reason
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+"""
+FOFA规则审核命令行入口
+
+各子命令只在执行时导入自己需要的模块，langchain、pandas等重量级依赖
+不会拖慢只需要FOFA接口的查重命令。
+
+用法:
+    python cli.py dup 'banner="AXIS P1448-LE"'
+    python cli.py info QUERY WEBSITE MANUFACTURER CLASS1 CLASS2
+    python cli.py rule QUERY
+    python cli.py full QUERY WEBSITE MANUFACTURER CLASS1 CLASS2 [--full-report] [--export]
+    python cli.py batch rules.xlsx --workers 4
+    python cli.py export rule_check_result.xlsx
+    python cli.py warm-products products.txt
+"""
+import argparse
+import json
+
+import batch
+from result_store import DEFAULT_STORE_PATH
+import product_stats
+
+
+def _print_json(result):
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except json.JSONDecodeError:
+            print(result)
+            return
+    print(json.dumps(result, indent=4, ensure_ascii=False, default=str))
+
+
+def cmd_dup(args):
+    from main import duplicate_check
+    _print_json(duplicate_check(args.query))
+
+
+def cmd_info(args):
+    from main import info_check
+    _print_json(info_check(args.query, args.website, args.manufacturer, args.class1, args.class2))
+
+
+def cmd_rule(args):
+    from main import rule_check
+    _print_json(rule_check(args.query))
+
+
+def cmd_full(args):
+    from main import rule2excel
+    result = rule2excel(args.query, args.website, args.manufacturer, args.class1, args.class2,
+                        full_report=args.full_report, export=args.export)
+    _print_json(result)
+
+
+def cmd_export(args):
+    from main import get_result_store
+    get_result_store(args.store, legacy_excel=args.output).export(args.output)
+
+
+def cmd_batch(args):
+    batch.review_file(args.input, workers=args.workers, store=args.store, output=args.output,
+                      full_report=args.full_report, metrics=args.metrics)
+
+
+def cmd_warm_products(args):
+    product_stats.warm_file(args.products, refresh=args.refresh)
+
+
+def _add_rule_arguments(parser, with_info=True):
+    parser.add_argument('query', help="FOFA规则")
+    if with_info:
+        parser.add_argument('website', help="产品官网地址")
+        parser.add_argument('manufacturer', help="厂商名")
+        parser.add_argument('class1', help="大类")
+        parser.add_argument('class2', help="小类")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="FOFA规则审核工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    dup = subparsers.add_parser('dup', help="规则重复性检查")
+    _add_rule_arguments(dup, with_info=False)
+    dup.set_defaults(func=cmd_dup)
+
+    info = subparsers.add_parser('info', help="厂商、分类、官网网址检查")
+    _add_rule_arguments(info)
+    info.set_defaults(func=cmd_info)
+
+    rule = subparsers.add_parser('rule', help="规则准确性检查")
+    _add_rule_arguments(rule, with_info=False)
+    rule.set_defaults(func=cmd_rule)
+
+    full = subparsers.add_parser('full', help="执行全部检查并写入结果文件")
+    _add_rule_arguments(full)
+    full.add_argument('--full-report', action='store_true', help="执行全部检查，不在结果确定后跳过剩余检查")
+    full.add_argument('--export', nargs='?', const="rule_check_result.xlsx", default=None,
+                      help="写入后导出结果文件(xlsx/csv/parquet)，默认只追加到结果存储")
+    full.set_defaults(func=cmd_full)
+
+    export = subparsers.add_parser('export', help="把结果存储导出为结果文件")
+    export.add_argument('output', nargs='?', default="rule_check_result.xlsx", help="导出的结果文件(xlsx/csv/parquet)")
+    export.add_argument('--store', default=DEFAULT_STORE_PATH, help="结果JSONL存储文件")
+    export.set_defaults(func=cmd_export)
+
+    batch_parser = subparsers.add_parser('batch', help="批量审核规则文件")
+    batch.add_arguments(batch_parser)
+    batch_parser.set_defaults(func=cmd_batch)
+
+    warm = subparsers.add_parser('warm-products', help="预热反向查重使用的产品统计缓存")
+    product_stats.add_arguments(warm)
+    warm.set_defaults(func=cmd_warm_products)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
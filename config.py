@@ -0,0 +1,32 @@
+import os
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """
+    加载.env文件中的环境变量，进程内只执行一次
+    """
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv()  # 加载.env文件
+            _loaded = True
+
+
+def load_environment():
+    """加载环境变量，并检查LLM相关的关键变量"""
+    load_env()
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "")
+    os.environ['SERPAPI_API_KEY'] = os.getenv("SERPAPI_API_KEY", "")
+
+    # 检查关键环境变量
+    if not os.environ["SERPAPI_API_KEY"]:
+        print("警告: SERPAPI_API_KEY 未设置")
+    if not os.environ["OPENAI_API_KEY"]:
+        print("警告: OPENAI_API_KEY 未设置")
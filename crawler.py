@@ -0,0 +1,188 @@
+"""
+厂商官网爬虫：流式读取响应并在达到字节上限时停止，按URL缓存页面到磁盘，
+过期后用ETag/Last-Modified条件请求重新验证，按主机复用连接。
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import SQLiteCache
+from config import load_env
+from metrics import record_crawl
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0'
+CACHE_PATH = os.path.join('.cache', 'crawl_cache.sqlite3')  # 可用环境变量CRAWL_CACHE_PATH覆盖
+CACHE_MAX_ENTRIES = 2000
+MAX_BYTES = 1024 * 1024  # 单个页面最多读取的字节数
+FRESH_SECONDS = 6 * 3600  # 缓存在该时间内直接使用，超过后发起条件请求重新验证
+CHUNK_SIZE = 64 * 1024
+
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?\s*([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+_BOMS = (
+    (b'\xef\xbb\xbf', 'utf-8'),
+    (b'\xff\xfe', 'utf-16-le'),
+    (b'\xfe\xff', 'utf-16-be'),
+)
+
+
+def _valid_encoding(name):
+    try:
+        ''.encode(name)
+        return True
+    except (LookupError, TypeError):
+        return False
+
+
+def detect_charset(raw, content_type=''):
+    """
+    根据原始字节检测字符集：依次参考BOM、Content-Type头、HTML meta标签，最后统计推断
+    """
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return encoding
+    match = re.search(r'charset=["\']?([a-zA-Z0-9_\-]+)', content_type or '', re.IGNORECASE)
+    if match and _valid_encoding(match.group(1)):
+        return match.group(1)
+    match = _META_CHARSET_RE.search(raw[:4096])
+    if match and _valid_encoding(match.group(1).decode('ascii')):
+        return match.group(1).decode('ascii')
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(raw[:CHUNK_SIZE]).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        pass
+    return 'utf-8'
+
+
+class Crawler:
+    """
+    带字节上限和条件请求缓存的网页爬虫
+
+    Args:
+        max_bytes: 单个页面最多读取的字节数
+        fresh_seconds: 缓存免验证的时间
+        cache: 页面缓存，为None时不缓存
+        timeout: (连接超时, 读取超时)
+        pool_size: 每个主机的连接池大小
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, fresh_seconds=FRESH_SECONDS, cache=None,
+                 timeout=(5, 10), pool_size=10):
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.cache = cache
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _download(self, url, entry):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        start = time.monotonic()
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and entry:
+                record_crawl(time.monotonic() - start, 0)
+                print(f"网页未修改，使用缓存: {url}")
+                return dict(entry, checked=time.time())
+            response.raise_for_status()
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_bytes:
+                    print(f"警告: 网页超过 {self.max_bytes} 字节，只读取前 {self.max_bytes} 字节: {url}")
+                    break
+            raw = b''.join(chunks)[:self.max_bytes]
+            record_crawl(time.monotonic() - start, size)
+            encoding = detect_charset(raw, response.headers.get('Content-Type', ''))
+
+            return {
+                'text': raw.decode(encoding, errors='replace'),
+                'encoding': encoding,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'checked': time.time(),
+            }
+
+    def fetch(self, url):
+        """
+        获取网页文本，同一URL同时只会有一个请求，其余调用方等待其结果；
+        重新验证失败但有过期缓存时返回过期内容
+
+        Raises:
+            requests.RequestException: 请求失败且没有可用缓存时抛出
+        """
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry and time.time() - entry.get('checked', 0) < self.fresh_seconds:
+            return entry['text']
+
+        with self._lock:
+            future = self._in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[url] = future
+
+        if owner:
+            try:
+                result = self._download(url, entry)
+                if self.cache is not None:
+                    self.cache.set(url, result)
+                future.set_result(result['text'])
+            except requests.RequestException as e:
+                if entry:
+                    print(f"网页请求失败，使用过期缓存: {url} -> {e}")
+                    future.set_result(entry['text'])
+                else:
+                    future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(url, None)
+        return future.result()
+
+
+_crawler = None
+_crawler_lock = threading.Lock()
+
+
+def get_crawler():
+    """
+    获取共享的Crawler实例，设置环境变量CRAWL_CACHE=0可关闭页面缓存
+    """
+    global _crawler
+    if _crawler is None:
+        with _crawler_lock:
+            if _crawler is None:
+                load_env()
+                cache = None
+                if os.getenv('CRAWL_CACHE', '1') != '0':
+                    path = os.getenv('CRAWL_CACHE_PATH', CACHE_PATH)
+                    cache = SQLiteCache(path, max_entries=CACHE_MAX_ENTRIES)
+                _crawler = Crawler(cache=cache)
+    return _crawler
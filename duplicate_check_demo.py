@@ -1,12 +1,6 @@
-import requests
-import base64
-import os
-from dotenv import load_dotenv
-import time
-
 from API import fofa_stats
-
-load_dotenv()  # 加载.env文件
+from product_stats import product_stats
+from rule_index import get_rule_index
 
 # def fofa_stats(query: str, fields: str = 'product1,product5,category1,category5'):
 #     """
@@ -40,6 +34,17 @@ load_dotenv()  # 加载.env文件
 #     except requests.exceptions.RequestException as e:
 #         return {"error": f"Request failed: {str(e)}"}
     
+def fofa_error(json_data):
+    """
+    返回FOFA响应中的错误信息，成功时返回None
+
+    FOFA出错时返回 "error": true 和errmsg，客户端请求失败时error字段为错误描述字符串
+    """
+    error = json_data.get('error')
+    if not error or error == 'false':
+        return None
+    return json_data.get('errmsg') or (error if isinstance(error, str) else "FOFA查询失败")
+
 def get_top_product(json_data):
     """
     从json数据中获取排名最高的产品名称及其数量
@@ -115,8 +120,13 @@ def check_duplicate(json_data, direction: str = "forward",
     
     elif direction == "reverse":
         # 反向查重：计算新规则的产品数量占现有规则总数量的比例
-        query = f'app="{product_name}"'
-        new_json_data = fofa_stats(query)
+        # 产品总数按产品名缓存，已知产品不再消耗统计接口配额
+        new_json_data = product_stats(product_name)
+        error = fofa_error(new_json_data)
+        if error:
+            result['error'] = f"反向查重统计失败: {error}"
+            result['failed'] = True
+            return result
         
         total_count = get_size(new_json_data)
         new_count = get_size(json_data)
@@ -133,12 +143,15 @@ def check_duplicate(json_data, direction: str = "forward",
     
     return result
 
-def is_duplicate(query: str):
+def is_duplicate(query: str, evidence=None):
     """
     完整的查重流程，综合正向和反向查重的结果
     
     Args:
         query: FOFA查询语句
+        evidence: 共享的RuleEvidence，传入时复用其中的统计数据
+        
+    配置了规则库（RULE_CORPUS_PATH）时先用本地索引判断，索引无法判断时再调用统计接口
         
     Returns:
         包含查重结果的字典
@@ -147,27 +160,42 @@ def is_duplicate(query: str):
         'query': query,
         'forward_check': None,
         'reverse_check': None,
+        'index_check': None,
         'is_duplicate': False,
         'top_product': None
     }
     
+    # 先查本地规则索引，能判断时不再消耗统计接口配额
+    index = get_rule_index()
+    if index is not None:
+        index_result = index.decide(query)
+        result['index_check'] = index_result
+        if index_result['decision'] is not None:
+            duplicate = index_result['decision'] == 'duplicate'
+            result['is_duplicate'] = duplicate
+            if duplicate:
+                result['top_product'] = index_result['candidates'][0]['product']
+            return result
+    
     # 获取查询数据
-    json_data = fofa_stats(query)
+    json_data = evidence.stats() if evidence is not None else fofa_stats(query)
     
-    if json_data['error'] == 'true':
-        result['error'] = json_data['errmsg']
+    # 统计失败时返回错误，由调用方按重复处理，避免未经查重的规则被录入
+    error = fofa_error(json_data)
+    if error:
+        result['error'] = error
         return result
     
     # 正向查重
     forward_result = check_duplicate(json_data, "forward")
     result['forward_check'] = forward_result
     
-    # 添加API请求间隔
-    time.sleep(3) # 统计聚合每5秒只允许查询一次
-    
-    # 反向查重
+    # 反向查重（fofa_stats已按统计接口配额自动限速）
     reverse_result = check_duplicate(json_data, "reverse")
     result['reverse_check'] = reverse_result
+    if reverse_result.get('failed'):
+        result['error'] = reverse_result['error']
+        return result
     
     # 综合判断
     result['top_product'] = forward_result.get('product_name')
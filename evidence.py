@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from API import fofa_stats
+from fetch_plan import FetchPlanner, DEFAULT_CONCURRENCY
+from fofa_query import condition, restrict
+
+# 每类子查询固定获取的字段，保证不同检查请求同一页时可以直接复用
+KIND_FIELDS = {
+    'service': 'banner',
+    'web': 'body,header',
+}
+
+
+class RuleEvidence:
+    """
+    单条规则的FOFA证据上下文，由重复性检查、厂商信息检查和规则准确性检查共享
+
+    统计数据和各页查询结果只请求一次并缓存在对象中；多个线程同时请求同一份数据时，
+    只有第一个请求方真正发起网络请求，其余请求方等待其结果。
+
+    Args:
+        query: FOFA查询语句
+        page_size: 每页条数
+        concurrency: 同时进行的FOFA请求数上限
+    """
+
+    def __init__(self, query, page_size=10, concurrency=DEFAULT_CONCURRENCY):
+        self.query = query
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.queries = {
+            'service': restrict(query, condition('type', 'service')),
+            'web': restrict(query, condition('type', 'service', op='!=')),
+        }
+        self._stats = None
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """
+        获取规则的统计聚合数据
+        """
+        with self._lock:
+            owner = self._stats is None
+            if owner:
+                self._stats = Future()
+            future = self._stats
+        if owner:
+            try:
+                future.set_result(fofa_stats(self.query))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    async def pages_async(self, kind, page_numbers, semaphore=None, size=None):
+        """
+        获取指定子查询的若干页结果
+
+        Args:
+            kind: 'service'(banner) 或 'web'(body和header)
+            page_numbers: 页码列表
+            semaphore: 可选的并发限制，多个调用共享同一个并发上限时传入
+            size: 每页条数，默认为page_size
+
+        Returns:
+            与page_numbers一一对应的页结果列表，每页为 {字段名: 结果列表, 'size': 总数, 'error': 错误}
+        """
+        query = self.queries[kind]
+        size = size or self.page_size
+        owned = []
+        futures = []
+        with self._lock:
+            for page in page_numbers:
+                future = self._pages.get((kind, page, size))
+                if future is None:
+                    future = Future()
+                    self._pages[(kind, page, size)] = future
+                    owned.append((page, future))
+                futures.append(future)
+
+        if owned:
+            planner = FetchPlanner(page_size=self.page_size)
+            keys = [(planner.add(query, KIND_FIELDS[kind], page=page, size=size), future) for page, future in owned]
+            try:
+                results = await planner.execute_async(self.concurrency, semaphore=semaphore)
+                for key, future in keys:
+                    future.set_result(results[key])
+            except BaseException as e:
+                # 请求失败时移除占位，允许后续调用重试
+                with self._lock:
+                    for page, future in owned:
+                        self._pages.pop((kind, page, size), None)
+                for _, future in keys:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+        return [await asyncio.wrap_future(future) for future in futures]
+
+    def pages(self, kind, page_numbers, size=None):
+        """
+        同步获取指定子查询的若干页结果
+        """
+        return asyncio.run(self.pages_async(kind, page_numbers, size=size))
@@ -0,0 +1,90 @@
+import asyncio
+
+from API import async_fofa_search
+
+DEFAULT_CONCURRENCY = 6
+
+
+def split_fields(result, fields):
+    """
+    将多字段查询结果按字段拆分为各自的列表
+
+    Args:
+        result: FOFA API返回的JSON数据
+        fields: 查询时使用的字段列表，顺序与结果中每行的顺序一致
+
+    Returns:
+        {字段名: 该字段的结果列表}
+    """
+    columns = {field: [] for field in fields}
+    for row in result.get('results', []):
+        # 单字段查询时每行可能直接是字符串
+        if not isinstance(row, list):
+            row = [row]
+        for i, field in enumerate(fields):
+            columns[field].append(row[i] if i < len(row) else '')
+    return columns
+
+
+class FetchPlanner:
+    """
+    FOFA请求规划器：把同一查询、同一页的多个字段请求合并为一次多字段调用，
+    执行后再按字段拆分结果，避免同一页被重复请求
+
+    用法:
+        planner = FetchPlanner()
+        planner.add(query, 'body', page=1)
+        planner.add(query, 'header', page=1)
+        pages = await planner.execute_async()
+        pages[(query, 1, 10)]['body']
+    """
+
+    def __init__(self, page_size=10):
+        self.page_size = page_size
+        self._requests = {}
+        self._results = {}
+
+    def add(self, query, fields, page=1, size=None):
+        """
+        登记一次请求，返回用于读取结果的键(query, page, size)
+        """
+        key = (query, page, size or self.page_size)
+        fields = [field.strip() for field in fields.split(',')]
+        if key in self._results and all(field in self._results[key] for field in fields):
+            return key
+        wanted = self._requests.setdefault(key, {})
+        for field in fields:
+            wanted[field] = None
+        return key
+
+    async def execute_async(self, concurrency=DEFAULT_CONCURRENCY, semaphore=None):
+        """
+        并发执行所有待处理的合并请求，传入semaphore时与其他调用共享并发上限
+
+        Returns:
+            {(query, page, size): {字段名: 结果列表, 'size': 总数, 'error': 是否出错}}
+        """
+        semaphore = semaphore or asyncio.Semaphore(concurrency)
+        pending = self._requests
+        self._requests = {}
+
+        async def fetch(key, fields):
+            query, page, size = key
+            async with semaphore:
+                result = await async_fofa_search(query, fields=','.join(fields), page=page, size=size)
+            page_result = split_fields(result, fields)
+            page_result['size'] = result.get('size', 0)
+            page_result['error'] = result.get('error')
+            self._results[key] = page_result
+
+        await asyncio.gather(*[fetch(key, list(fields)) for key, fields in pending.items()])
+        return self._results
+
+    def execute(self, concurrency=DEFAULT_CONCURRENCY):
+        return asyncio.run(self.execute_async(concurrency=concurrency))
+
+    def request_count(self):
+        """
+        返回待执行的合并请求数
+        """
+        return len(self._requests)
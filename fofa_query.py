@@ -0,0 +1,256 @@
+"""
+FOFA查询语法解析与规范化
+
+把规则解析为语法树（field="v"、field=="v"、!=、*=、~=、&&、||、括号、引号内转义），
+再输出规范形式：字段名小写、值统一加引号、去掉多余括号、同级条件去重并排序。
+空白、条件顺序或括号写法不同的等价规则得到相同的规范形式，用于缓存键和批次内的等价规则识别。
+
+规范形式会按假定的 && / || 优先级重排条件，只用作键，不发送给FOFA；
+发送给FOFA的子查询由restrict()在规则原文上追加条件。
+
+引号内只有 \" 和 \\ 是转义，其他反斜杠（如正则中的 \d、Windows路径）按原样保留。
+
+    >>> canonicalize('(title="b" &&  banner="a") && title="b"')
+    'banner="a" && title="b"'
+    >>> restrict('banner="a" || banner="b"', condition('type', 'service'))
+    '(banner="a" || banner="b") && type="service"'
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+OPERATORS = ('==', '!=', '*=', '~=', '=')
+_BARE_STOP = set(' \t\r\n()&|"')
+
+
+class QueryError(ValueError):
+    """
+    查询语句无法解析
+    """
+
+
+@dataclass(frozen=True)
+class Condition:
+    field: str
+    op: str
+    value: str
+
+
+@dataclass(frozen=True)
+class Term:
+    """
+    不带字段名的全文检索关键词，如 "nginx"
+    """
+    value: str
+
+
+@dataclass(frozen=True)
+class And:
+    items: tuple
+
+
+@dataclass(frozen=True)
+class Or:
+    items: tuple
+
+
+def _tokenize(query):
+    """
+    切分为 (类型, 值, 位置) 序列，类型为 ( ) && || op ident string bare
+    """
+    tokens = []
+    i = 0
+    n = len(query)
+    while i < n:
+        ch = query[i]
+        if ch.isspace():
+            i += 1
+        elif ch in '()':
+            tokens.append((ch, ch, i))
+            i += 1
+        elif query.startswith('&&', i) or query.startswith('||', i):
+            tokens.append((query[i:i + 2], query[i:i + 2], i))
+            i += 2
+        elif ch == '"':
+            start = i
+            i += 1
+            chars = []
+            while i < n and query[i] != '"':
+                if query[i] == '\\' and i + 1 < n and query[i + 1] in '"\\':
+                    i += 1
+                chars.append(query[i])
+                i += 1
+            if i >= n:
+                raise QueryError(f"引号未闭合，位置 {start}: {query}")
+            tokens.append(('string', ''.join(chars), start))
+            i += 1
+        else:
+            op = next((op for op in OPERATORS if query.startswith(op, i)), None)
+            if op:
+                tokens.append(('op', op, i))
+                i += len(op)
+                continue
+            start = i
+            while i < n and query[i] not in _BARE_STOP and not any(query.startswith(op, i) for op in OPERATORS):
+                i += 1
+            if i == start:
+                raise QueryError(f"无法识别的字符 {ch!r}，位置 {i}: {query}")
+            word = query[start:i]
+            prev = tokens[-1][0] if tokens else None
+            tokens.append(('bare' if prev == 'op' else 'ident', word, start))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, query):
+        self.query = query
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            where = self.tokens[self.pos][2] if self.pos < len(self.tokens) else len(self.query)
+            raise QueryError(f"期望 {kind}，位置 {where}: {self.query}")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("查询语句为空")
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"多余的内容，位置 {self.tokens[self.pos][2]}: {self.query}")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() == '||':
+            self.pos += 1
+            items.append(self.parse_and())
+        return or_(*items)
+
+    def parse_and(self):
+        items = [self.parse_primary()]
+        while self.peek() == '&&':
+            self.pos += 1
+            items.append(self.parse_primary())
+        return and_(*items)
+
+    def parse_primary(self):
+        kind = self.peek()
+        if kind == '(':
+            self.pos += 1
+            node = self.parse_or()
+            self.take(')')
+            return node
+        if kind == 'string':
+            return Term(self.take('string'))
+        field = self.take('ident')
+        op = self.take('op')
+        if self.peek() == 'string':
+            value = self.take('string')
+        else:
+            value = self.take('bare')
+        return Condition(field.lower(), op, value)
+
+
+def _quote(value):
+    """
+    给值加引号：引号转义为 \\"，反斜杠只在其后是引号、反斜杠或值末尾时转义，其余按原样输出
+    """
+    chars = []
+    for i, ch in enumerate(value):
+        if ch == '"':
+            chars.append('\\"')
+        elif ch == '\\' and (i + 1 == len(value) or value[i + 1] in '"\\'):
+            chars.append('\\\\')
+        else:
+            chars.append(ch)
+    return '"' + ''.join(chars) + '"'
+
+
+def to_string(node):
+    """
+    输出语法树的规范形式
+    """
+    if isinstance(node, Condition):
+        return f'{node.field}{node.op}{_quote(node.value)}'
+    if isinstance(node, Term):
+        return _quote(node.value)
+    if isinstance(node, And):
+        return ' && '.join(f'({to_string(item)})' if isinstance(item, Or) else to_string(item)
+                           for item in node.items)
+    return ' || '.join(to_string(item) for item in node.items)
+
+
+def _combine(cls, nodes):
+    """
+    合并同类子节点，去重并按规范形式排序，只剩一个子节点时直接返回该节点
+    """
+    flat = {}
+    for node in nodes:
+        for item in (node.items if isinstance(node, cls) else (node,)):
+            flat.setdefault(to_string(item), item)
+    if len(flat) == 1:
+        return next(iter(flat.values()))
+    return cls(tuple(flat[key] for key in sorted(flat)))
+
+
+def and_(*nodes):
+    return _combine(And, nodes)
+
+
+def or_(*nodes):
+    return _combine(Or, nodes)
+
+
+def condition(field, value, op='='):
+    if op not in OPERATORS:
+        raise QueryError(f"不支持的运算符: {op}")
+    return Condition(field.lower(), op, str(value))
+
+
+@lru_cache(maxsize=4096)
+def parse(query):
+    """
+    解析查询语句为语法树，结果按语句缓存
+
+    Raises:
+        QueryError: 语法错误
+    """
+    return _Parser(query).parse()
+
+
+@lru_cache(maxsize=4096)
+def canonicalize(query):
+    """
+    返回查询语句的规范形式，等价写法得到相同结果
+
+    Raises:
+        QueryError: 语法错误
+    """
+    return to_string(parse(query))
+
+
+def restrict(query, *conditions):
+    """
+    在规则原文上追加 && 条件，返回可直接发送给FOFA的查询语句
+
+    原文整体加括号，不经过规范化，保证FOFA收到的仍是被审核的规则
+    """
+    return ' && '.join(['(' + query.strip() + ')'] + [to_string(c) for c in conditions])
+
+
+def iter_conditions(node, include_negative=False):
+    """
+    遍历语法树中的字段条件，默认跳过 != 条件
+    """
+    if isinstance(node, Condition):
+        if include_negative or node.op != '!=':
+            yield node
+    elif isinstance(node, (And, Or)):
+        for item in node.items:
+            yield from iter_conditions(item, include_negative)
@@ -0,0 +1,140 @@
+"""
+HTTP响应头本地聚类：对响应头做规范化和SimHash指纹，按汉明距离分组，
+结果可复现，不依赖LLM。
+"""
+import hashlib
+import re
+
+import numpy as np
+
+# 每次请求都会变化、不反映服务器配置的响应头
+VOLATILE_HEADERS = {
+    'date', 'expires', 'last-modified', 'etag', 'content-length', 'age',
+    'x-request-id', 'x-trace-id', 'x-runtime', 'cf-ray', 'x-amz-cf-id',
+    'report-to', 'nel', 'keep-alive',
+}
+
+# 指纹特征的权重，关键字段的取值比普通字段名更能说明服务器类型
+FEATURE_WEIGHTS = {
+    'server': 4,
+    'x-powered-by': 4,
+    'content-type': 2,
+    'cookie': 2,
+    'status': 1,
+    'name': 1,
+    'line': 2,
+}
+
+DEFAULT_MAX_GROUPS = 5
+DEFAULT_DISTANCE = 10  # 64位指纹中允许的最大差异位数
+
+_STATUS_RE = re.compile(r'^HTTP/[\d.]+\s+(\d{3})')
+_VOLATILE_VALUE_RE = re.compile(r'\d+')
+
+
+def header_features(header):
+    """
+    将原始响应头规范化为带权重的特征列表
+
+    丢弃Date、ETag、Content-Length等易变字段，Set-Cookie只保留cookie名，
+    Server等取值中的数字（版本号）统一替换，减少同一产品不同版本间的差异。
+    非键值行按整行取特征，因此同样适用于协议banner。
+    """
+    features = []
+    for line in str(header).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        status = _STATUS_RE.match(line)
+        if status:
+            features.append((f"status:{status.group(1)}", FEATURE_WEIGHTS['status']))
+            continue
+        if ':' not in line:
+            # 非键值行（如SSH、FTP等协议banner）整行作为特征，数字统一替换
+            features.append((f"line:{_VOLATILE_VALUE_RE.sub('0', line.lower())}", FEATURE_WEIGHTS['line']))
+            continue
+        name, value = line.split(':', 1)
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name in VOLATILE_HEADERS:
+            continue
+        features.append((f"name:{name}", FEATURE_WEIGHTS['name']))
+        if name == 'set-cookie':
+            cookie_name = value.split('=', 1)[0].strip()
+            features.append((f"cookie:{cookie_name}", FEATURE_WEIGHTS['cookie']))
+        elif name in ('server', 'x-powered-by', 'content-type'):
+            value = _VOLATILE_VALUE_RE.sub('0', value)
+            features.append((f"{name}:{value}", FEATURE_WEIGHTS[name]))
+    return features
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash_matrix(header_list):
+    """
+    计算每个响应头的64位SimHash指纹
+
+    Returns:
+        形状为(n, 64)的0/1矩阵
+    """
+    fingerprints = np.zeros((len(header_list), 64), dtype=np.uint8)
+    for i, header in enumerate(header_list):
+        features = header_features(header)
+        if not features:
+            continue
+        hashes = np.array([_token_hash(token) for token, _ in features], dtype=np.uint64)
+        weights = np.array([weight for _, weight in features], dtype=np.int64)
+        # 展开为(特征数, 64)的比特矩阵，按权重累加后取符号
+        bits = ((hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)).astype(np.int64)
+        scores = (weights[:, None] * (2 * bits - 1)).sum(axis=0)
+        fingerprints[i] = scores > 0
+    return fingerprints
+
+
+def hamming_matrix(fingerprints):
+    """
+    计算指纹两两之间的汉明距离
+    """
+    return (fingerprints[:, None, :] != fingerprints[None, :, :]).sum(axis=2)
+
+
+def cluster_headers(header_list, max_groups=DEFAULT_MAX_GROUPS, max_distance=DEFAULT_DISTANCE):
+    """
+    对响应头分组，返回索引分组列表，例如 [[0, 2, 5], [1, 4], [3]]
+
+    先按领头者算法把距离不超过max_distance的响应头归为一组，
+    组数超过max_groups时，把最小的组并入距离最近的组，直到满足上限。
+
+    Args:
+        header_list: 响应头列表
+        max_groups: 最大分组数，None表示不限制
+        max_distance: 同组指纹允许的最大汉明距离
+    """
+    if not header_list:
+        return []
+
+    distances = hamming_matrix(simhash_matrix(header_list))
+
+    leaders = []
+    groups = []
+    for i in range(len(header_list)):
+        if leaders:
+            leader_distances = distances[i, leaders]
+            nearest = int(np.argmin(leader_distances))
+            if leader_distances[nearest] <= max_distance:
+                groups[nearest].append(i)
+                continue
+        leaders.append(i)
+        groups.append([i])
+
+    while max_groups and len(groups) > max_groups:
+        smallest = min(range(len(groups)), key=lambda g: (len(groups[g]), -g))
+        others = [g for g in range(len(groups)) if g != smallest]
+        target = min(others, key=lambda g: distances[leaders[smallest], leaders[g]])
+        groups[target].extend(groups[smallest])
+        del groups[smallest]
+        del leaders[smallest]
+
+    return sorted(sorted(group) for group in groups)
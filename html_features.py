@@ -0,0 +1,129 @@
+"""
+HTML特征提取：从FOFA返回的body或爬取的网页中提取标题、meta、资源路径、
+版权和厂商信息、型号等关键特征，压缩成适合放入提示词的紧凑文本。
+"""
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+DEFAULT_BUDGET = 3000  # 单条特征记录的最大字符数
+
+META_NAMES = ('description', 'keywords', 'generator', 'author', 'application-name',
+              'og:site_name', 'og:title', 'copyright')
+
+_COPYRIGHT_RE = re.compile(r'(?:©|\(c\)|copyright)\s*[^\n<>{}]{2,100}', re.IGNORECASE)
+_POWERED_RE = re.compile(r'(?:powered by|designed by|developed by|技术支持[:：]?)\s*[^\n<>{}]{2,60}', re.IGNORECASE)
+_MODEL_RE = re.compile(r'\b[A-Z]{1,6}[-_ ]?\d{2,6}[A-Z0-9\-_]{0,10}\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def _clean(text, limit=200):
+    return _SPACE_RE.sub(' ', text or '').strip()[:limit]
+
+
+def _unique(items, limit):
+    seen = []
+    for item in items:
+        if item and item not in seen:
+            seen.append(item)
+            if len(seen) >= limit:
+                break
+    return seen
+
+
+def extract_features(html):
+    """
+    提取HTML中的关键特征
+
+    Returns:
+        {
+            'title': 标题,
+            'meta': {meta名: 内容},
+            'resources': script/link/img等资源路径列表,
+            'copyright': 版权和厂商声明列表,
+            'models': 疑似型号的字符串列表,
+            'text': 可见文本片段,
+        }
+    """
+    soup = BeautifulSoup(html or '', HTML_PARSER)
+
+    title = _clean(soup.title.get_text()) if soup.title else ''
+
+    meta = {}
+    for tag in soup.find_all('meta'):
+        name = (tag.get('name') or tag.get('property') or '').lower()
+        if name in META_NAMES and tag.get('content'):
+            meta[name] = _clean(tag.get('content'))
+
+    resources = []
+    for tag, attr in (('script', 'src'), ('link', 'href'), ('img', 'src'), ('iframe', 'src')):
+        for element in soup.find_all(tag):
+            value = element.get(attr)
+            if value and not value.startswith('data:'):
+                resources.append(value.split('?', 1)[0])
+
+    for element in soup(['script', 'style', 'noscript', 'svg']):
+        element.decompose()
+    text = _clean(soup.get_text(' '), limit=100000)
+
+    copyright = _unique(
+        [_clean(m) for m in _COPYRIGHT_RE.findall(text)] + [_clean(m) for m in _POWERED_RE.findall(text)],
+        limit=5,
+    )
+    models = _unique(_MODEL_RE.findall(title + ' ' + ' '.join(meta.values()) + ' ' + text), limit=15)
+
+    return {
+        'title': title,
+        'meta': meta,
+        'resources': _unique(resources, limit=30),
+        'copyright': copyright,
+        'models': models,
+        'text': text,
+    }
+
+
+def format_features(features, budget=DEFAULT_BUDGET):
+    """
+    将特征记录格式化为紧凑文本，按重要性依次填充，总长度不超过budget
+    """
+    sections = []
+    if features['title']:
+        sections.append(f"标题: {features['title']}")
+    for name, content in features['meta'].items():
+        sections.append(f"meta[{name}]: {content}")
+    if features['copyright']:
+        sections.append("版权/厂商: " + ' | '.join(features['copyright']))
+    if features['models']:
+        sections.append("疑似型号: " + ', '.join(features['models']))
+    if features['resources']:
+        sections.append("资源路径: " + ', '.join(features['resources']))
+
+    lines = []
+    used = 0
+    for section in sections:
+        if used + len(section) + 1 > budget:
+            section = section[:max(budget - used - 1, 0)]
+        if section:
+            lines.append(section)
+            used += len(section) + 1
+        if used >= budget:
+            return '\n'.join(lines)
+
+    # 剩余预算填充可见文本
+    remaining = budget - used - len("可见文本: ")
+    if features['text'] and remaining > 50:
+        lines.append("可见文本: " + features['text'][:remaining])
+    return '\n'.join(lines)
+
+
+def html_to_features(html, budget=DEFAULT_BUDGET):
+    """
+    提取HTML特征并格式化为不超过budget字符的文本
+    """
+    return format_features(extract_features(html), budget=budget)
@@ -0,0 +1,81 @@
+"""
+共享的LLM客户端和提示词链注册表
+
+每个模型端点只创建一个ChatOpenAI实例，底层httpx连接池保持长连接；
+提示词模板和LLMChain在首次使用时编译一次，之后直接复用。
+"""
+import os
+import threading
+
+# 模型配置，可通过环境变量覆盖
+DEFAULT_MODEL = "qwen"
+DEFAULT_API_BASE = "http://211.91.254.226:2440/v1"
+LLM_TIMEOUT = 120  # 单次请求超时，单位秒
+LLM_MAX_CONNECTIONS = 20  # 每个端点的最大连接数
+
+_lock = threading.Lock()
+_clients = {}
+_chains = {}
+
+
+def llm_settings():
+    """
+    返回当前配置的模型名和接口地址
+    """
+    return {
+        'model': os.getenv('LLM_MODEL', DEFAULT_MODEL),
+        'api_base': os.getenv('LLM_API_BASE', DEFAULT_API_BASE),
+        'verbose': os.getenv('LLM_VERBOSE', '0') == '1',
+    }
+
+
+def get_llm(model=None, api_base=None):
+    """
+    获取指定端点共享的LLM客户端，首次调用时创建
+    """
+    settings = llm_settings()
+    model = model or settings['model']
+    api_base = api_base or settings['api_base']
+    key = (api_base, model)
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                import httpx
+                from langchain_openai import ChatOpenAI
+
+                limits = httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                )
+                _clients[key] = ChatOpenAI(
+                    model=model,
+                    openai_api_base=api_base,
+                    verbose=settings['verbose'],
+                    timeout=LLM_TIMEOUT,
+                    http_client=httpx.Client(limits=limits, timeout=LLM_TIMEOUT),
+                    http_async_client=httpx.AsyncClient(limits=limits, timeout=LLM_TIMEOUT),
+                )
+    return _clients[key]
+
+
+def get_chain(name, template, input_variables, llm=None):
+    """
+    获取已编译的提示词链，同一名称和LLM客户端只编译一次
+
+    Args:
+        name: 提示词链名称
+        template: 提示词模板
+        input_variables: 模板变量列表
+        llm: LLM客户端，默认使用get_llm()
+    """
+    llm = llm or get_llm()
+    key = (name, id(llm))
+    if key not in _chains:
+        with _lock:
+            if key not in _chains:
+                from langchain.prompts import PromptTemplate
+                from langchain.chains import LLMChain
+
+                prompt = PromptTemplate(input_variables=list(input_variables), template=template)
+                _chains[key] = LLMChain(llm=llm, prompt=prompt)
+    return _chains[key]
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cache import SQLiteCache
+from config import load_env
+from metrics import record_llm, record_llm_cache_hit
+
+# LLM响应缓存配置，设置环境变量LLM_CACHE=0可整体关闭缓存
+CACHE_PATH = os.path.join('.cache', 'llm_cache.sqlite3')  # 可用环境变量LLM_CACHE_PATH覆盖
+CACHE_MAX_ENTRIES = 5000
+CACHE_TTL = 30 * 24 * 3600
+
+# 参与缓存键计算的生成参数
+GENERATION_PARAMS = ('temperature', 'max_tokens', 'top_p', 'openai_api_base')
+
+_cache = None
+_cache_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'seconds_saved': 0.0,
+    'tokens_saved': 0,
+}
+
+
+def get_cache():
+    """
+    获取共享的LLM响应缓存，未启用时返回None
+    """
+    global _cache
+    load_env()
+    if os.getenv('LLM_CACHE', '1') == '0':
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLiteCache(os.getenv('LLM_CACHE_PATH', CACHE_PATH), max_entries=CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def prompt_key(chain, inputs):
+    """
+    根据模型名、渲染后的提示词和生成参数计算内容寻址的缓存键
+    """
+    llm = chain.llm
+    model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+    params = {name: getattr(llm, name, None) for name in GENERATION_PARAMS}
+    rendered = chain.prompt.format(**inputs)
+    payload = json.dumps([model, rendered, params], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _record(**deltas):
+    with _stats_lock:
+        for name, value in deltas.items():
+            _stats[name] += value
+
+
+def cached_run(chain, refresh=False, **inputs):
+    """
+    带缓存的chain.run，命中时直接返回缓存的输出
+
+    Args:
+        chain: LLMChain
+        refresh: 为True时忽略已有缓存并重新生成
+        inputs: 提示词变量
+    """
+    cache = get_cache()
+    key = prompt_key(chain, inputs) if cache is not None else None
+    if cache is not None and not refresh:
+        entry = cache.get(key, ttl=CACHE_TTL)
+        if entry is not None:
+            _record(hits=1, seconds_saved=entry.get('seconds', 0.0), tokens_saved=entry.get('tokens', 0))
+            record_llm_cache_hit()
+            return entry['text']
+    _record(misses=1)
+
+    from langchain_community.callbacks import get_openai_callback
+
+    start = time.monotonic()
+    with get_openai_callback() as callback:
+        text = chain.run(**inputs)
+    elapsed = time.monotonic() - start
+    record_llm(elapsed, callback.prompt_tokens, callback.completion_tokens)
+
+    if cache is not None and text:
+        cache.set(key, {'text': text, 'seconds': elapsed, 'tokens': callback.total_tokens})
+    return text
+
+
+def cached_batch(chain, inputs_list, max_concurrency=4, refresh=False):
+    """
+    带缓存的批量生成：先查缓存，未命中的输入通过chain.batch并发生成
+
+    Args:
+        chain: LLMChain
+        inputs_list: 提示词变量字典的列表
+        max_concurrency: 同时在途的LLM请求数上限
+        refresh: 为True时忽略已有缓存并重新生成
+
+    Returns:
+        与inputs_list一一对应的列表，元素为生成的文本，单条失败时为对应的异常
+    """
+    cache = get_cache()
+    outputs = [None] * len(inputs_list)
+    keys = [None] * len(inputs_list)
+    pending = []
+    for i, inputs in enumerate(inputs_list):
+        if cache is not None:
+            keys[i] = prompt_key(chain, inputs)
+            entry = None if refresh else cache.get(keys[i], ttl=CACHE_TTL)
+            if entry is not None:
+                _record(hits=1, seconds_saved=entry.get('seconds', 0.0), tokens_saved=entry.get('tokens', 0))
+                record_llm_cache_hit()
+                outputs[i] = entry['text']
+                continue
+        pending.append(i)
+    if not pending:
+        return outputs
+    _record(misses=len(pending))
+
+    from langchain_community.callbacks import get_openai_callback
+
+    start = time.monotonic()
+    with get_openai_callback() as callback:
+        results = chain.batch(
+            [inputs_list[i] for i in pending],
+            config={'max_concurrency': max_concurrency},
+            return_exceptions=True,
+        )
+    elapsed = time.monotonic() - start
+    record_llm(elapsed, callback.prompt_tokens, callback.completion_tokens, calls=len(pending))
+    # 批量调用只能拿到总耗时和总token数，按条数折算为单条的近似值
+    seconds = elapsed * min(len(pending), max_concurrency) / len(pending)
+    tokens = callback.total_tokens // len(pending)
+
+    for i, result in zip(pending, results):
+        if isinstance(result, Exception):
+            outputs[i] = result
+            continue
+        text = result.get(chain.output_key) if isinstance(result, dict) else result
+        outputs[i] = text
+        if cache is not None and text:
+            cache.set(keys[i], {'text': text, 'seconds': seconds, 'tokens': tokens})
+    return outputs
+
+
+def cache_report():
+    """
+    返回LLM缓存的命中率以及节省的LLM耗时和token数
+    """
+    with _stats_lock:
+        report = dict(_stats)
+    total = report['hits'] + report['misses']
+    report['hit_rate'] = report['hits'] / total if total else 0.0
+    return report
@@ -1,23 +1,25 @@
 import os
-from dotenv import load_dotenv
-load_dotenv()
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-
 import json
-from openai import OpenAI
-import pandas as pd
-from datetime import datetime
+import time
 
+from config import load_env
 from duplicate_check_demo import is_duplicate
-from check_info import check
-from check_rule import rule
+from result_store import ResultStore, DEFAULT_STORE_PATH
+from task_graph import TaskGraph
+from evidence import RuleEvidence
+from llm_cache import cache_report
+from metrics import collect, stage, format_summary, write_metrics
+
+load_env()
 
+EXCEL_FILE = "rule_check_result.xlsx"
 
-def duplicate_check(rule):
+def duplicate_check(rule, evidence=None):
     """
     执行FOFA规则重复性检查
     Args:
         rule (str): FOFA规则
+        evidence (RuleEvidence): 共享的规则证据上下文
     Returns:
         error (bool): 是否有错误
         is_duplicate (bool): 是否重复
@@ -25,7 +27,7 @@ def duplicate_check(rule):
         product (str): 已有的产品名称
     """
     print("=============开始执行规则重复性检查============")
-    result = is_duplicate(rule)
+    result = is_duplicate(rule, evidence=evidence)
 
     # 返回错误原因
     if 'error' in result:
@@ -45,6 +47,16 @@ def duplicate_check(rule):
             'product': '无记录'
         })
 
+    index_check = result.get('index_check') or {}
+    if index_check.get('decision') == 'duplicate':
+        candidate = index_check['candidates'][0]
+        return json.dumps({
+            'error': False,
+            'is_duplicate': duplicate,
+            'reason': f"规则库中产品 \"{candidate['product']}\" 的规则与当前规则相似度为 {candidate['score']:.2f}，共同特征: {', '.join(candidate['shared'])}。",
+            'product': candidate['product']
+        })
+
     f_ratio = result.get('forward_check', {}).get('ratio', 0)
     r_ratio = result.get('reverse_check', {}).get('ratio', 0)
     product_name = result.get('top_product', '无记录')
@@ -57,110 +69,238 @@ def duplicate_check(rule):
         'product': product_name
     })
 
-def info_check(rule, webside, manufacturer, classification1, classification2):
+def info_check(rule, webside, manufacturer, classification1, classification2, evidence=None, full_report=False):
     """
     根据规则内容，判断厂商、分类、官网网址是否准确
     """
     print("\n\n=============开始执行规则的厂商、分类、官网网址检查===============\n\n")
-    res = check(rule, webside, manufacturer, classification1, classification2)
+    from check_info import check  # 依赖langchain，按需导入
+    res = check(rule, webside, manufacturer, classification1, classification2, evidence=evidence,
+                full_report=full_report)
     return res
 
-def rule_check(guize):
+def rule_check(guize, evidence=None):
     """
     执行规则检查
     """
     print("\n\n=============开始执行规则检查============\n\n")
-    result = rule(guize)
+    from check_rule import rule  # 依赖langchain和numpy，按需导入
+    result = rule(guize, evidence=evidence)
     return result
 
-def rule2excel(query, webside, manufacturer, classification1, classification2):
+# 各项检查的大致成本，短路模式下按成本从低到高依次执行
+CHECK_COSTS = {
+    'duplicate_check': 1,  # 两次统计请求，常可由本地规则库直接判定
+    'info_check': 5,  # 爬取官网 + 多次LLM调用
+    'rule_check': 10,  # 多页FOFA抽样 + body总结 + 内容检测
+}
+
+# 每项检查产出的结果条目
+CHECK_ENTRIES = {
+    'duplicate_check': ('duplicate_check',),
+    'info_check': ('website_check', 'manufacturer_check', 'classification_check'),
+    'rule_check': ('rule_check',),
+}
+
+# 检查名称，用于说明跳过原因
+CHECK_LABELS = {
+    'duplicate_check': "重复性检查",
+    'info_check': "厂商、分类、官网网址检查",
+    'rule_check': "规则准确性检查",
+}
+
+# 结果条目在原因中的名称，按输出顺序排列
+ENTRY_LABELS = {
+    'website_check': "网站检查",
+    'manufacturer_check': "厂商检查",
+    'classification_check': "分类检查",
+    'rule_check': "规则检查",
+    'duplicate_check': "重复性检查",
+}
+
+
+def check_entries(name, result=None, error=None):
     """
-    将所有规则信息转换为Excel格式
+    把单项检查的原始结果转换为info_result中的条目
+    """
+    if name == 'info_check':
+        if error is not None:
+            reason = f"检查失败: {error}"
+            return {entry: {"result": False, "reason": reason} for entry in CHECK_ENTRIES[name]}
+        return {entry: result[entry] for entry in CHECK_ENTRIES[name]}
+
+    if name == 'duplicate_check':
+        # 检查失败时按重复处理，避免未经查重的规则被录入
+        if error is not None:
+            return {name: {"result": True, "reason": f"检查失败: {error}"}}
+        if result['error']:
+            print(f"error: {result['message']}")
+            return {name: {"result": True, "reason": f"检查失败: {result['message']}"}}
+        return {name: {"result": result['is_duplicate'], "reason": result['reason']}}
+
+    if error is not None:
+        return {name: {"result": False, "reason": f"检查失败: {error}"}}
+    return {name: {"result": result['result'], "reason": result['reason']}}
+
+
+def entry_failed(name, entry):
+    """
+    结果条目是否导致规则不录入，重复性检查的result为True表示重复，跳过的条目不计入
+    """
+    if entry.get('skipped'):
+        return False
+    if name == 'duplicate_check':
+        return bool(entry['result'])
+    return not entry['result']
+
+
+def staged(name, fn):
+    """
+    包装检查函数，执行期间的成本统计记入该检查阶段
+    """
+    def run():
+        with stage(name):
+            return fn()
+    return run
+
+
+def run_checks(checks, full_report=False):
+    """
+    执行各项检查
+
+    完整报告模式下所有检查并发执行；否则按CHECK_COSTS从低到高依次执行，
+    任一检查判定不录入后跳过剩余检查。
+
+    Args:
+        checks: {检查名: 无参函数}
+        full_report: 是否执行全部检查
+
+    Returns:
+        (info_result, 跳过的检查名列表, 各项检查耗时)
+    """
+    checks = {name: staged(name, fn) for name, fn in checks.items()}
+    info_result = {}
+    if full_report:
+        # 各项检查共享同一份FOFA证据，互不依赖，并发执行后再合并结果
+        graph = TaskGraph()
+        for name, fn in checks.items():
+            graph.add(name, fn)
+        outcome = graph.run()
+        for name in checks:
+            info_result.update(check_entries(name, outcome['results'].get(name), outcome['errors'].get(name)))
+        return info_result, [], outcome['timings']
+
+    skipped = []
+    timings = {}
+    rejected_by = None
+    for name in sorted(checks, key=CHECK_COSTS.get):
+        if rejected_by is not None:
+            skipped.append(name)
+            reason = f"已跳过: {CHECK_LABELS[rejected_by]}已判定不录入"
+            for entry in CHECK_ENTRIES[name]:
+                info_result[entry] = {"result": None, "reason": reason, "skipped": True}
+            continue
+
+        start = time.monotonic()
+        try:
+            entries = check_entries(name, result=checks[name]())
+        except Exception as e:
+            entries = check_entries(name, error=e)
+        timings[name] = time.monotonic() - start
+        info_result.update(entries)
+        if any(entry_failed(entry, value) for entry, value in entries.items()):
+            rejected_by = name
+    return info_result, skipped, timings
+
+
+def review_rule(query, webside, manufacturer, classification1, classification2, full_report=False):
     """
-    # 执行规则重复性检查
-    result = duplicate_check(query)
-    result = json.loads(result)
-    print("=============规则重复性检查结果============")
-    print(result)
-
-    # 执行规则厂商、分类、官网网址检查
-    if not result['error']:
-        info_result = info_check(query, webside, manufacturer, classification1, classification2)
-        print("=============规则厂商、分类、官网网址检查结果============")
-        print(info_result)
-        # 确保duplicate_check键存在
-        if 'duplicate_check' not in info_result:
-            info_result['duplicate_check'] = {}
-        info_result['duplicate_check']['result'] = result['is_duplicate']
-        info_result['duplicate_check']['reason'] = result['reason']
-    else:
-        print(f"error: {result['message']}")
-
-    # 执行规则准确性检查
-    if not result['error']:
-        rule_result = rule_check(query)
-        print("=============规则准确性检查结果============")
-        print(rule_result)
-        # 确保rule_check键存在
-        if 'rule_check' not in info_result:
-            info_result['rule_check'] = {}
-        info_result['rule_check']['result'] = rule_result['result']
-        info_result['rule_check']['reason'] = rule_result['reason']
+    对单条规则执行检查，返回Excel数据行和详细结果
+
+    默认按成本从低到高执行并在结果确定后短路，full_report为True时执行全部检查以获得完整原因
+    """
+    evidence = RuleEvidence(query)
+    checks = {
+        'duplicate_check': lambda: json.loads(duplicate_check(query, evidence)),
+        'info_check': lambda: info_check(query, webside, manufacturer, classification1, classification2, evidence,
+                                         full_report=full_report),
+        'rule_check': lambda: rule_check(query, evidence),
+    }
+    with collect() as rule_metrics:
+        info_result, skipped, timings = run_checks(checks, full_report=full_report)
+    timings = {name: round(seconds, 2) for name, seconds in timings.items()}
+    cost = rule_metrics.summary()
+    print(f"各项检查耗时(秒): {timings}")
+    print(f"成本统计:\n{format_summary(cost)}")
+    if skipped:
+        print(f"已跳过的检查: {skipped}")
 
     print("\n\n=============最终结果============")
     print(json.dumps(info_result, indent=4, ensure_ascii=False))
 
-    # 将结果转换为Excel格式
-    main_true = False
-    if info_result['website_check']['result'] and info_result['manufacturer_check']['result'] and info_result['classification_check']['result'] and info_result['rule_check']['result'] and not info_result['duplicate_check']['result']:
-        main_true = True
+    # 所有检查都执行且通过时才录入
+    main_true = not skipped and not any(entry_failed(name, info_result[name]) for name in ENTRY_LABELS)
 
     # 整合原因信息
-    reason_details = []
-    if not info_result['website_check']['result']:
-        reason_details.append(f"网站检查: {info_result['website_check']['reason']}")
-    if not info_result['manufacturer_check']['result']:
-        reason_details.append(f"厂商检查: {info_result['manufacturer_check']['reason']}")
-    if not info_result['classification_check']['result']:
-        reason_details.append(f"分类检查: {info_result['classification_check']['reason']}")
-    if not info_result['rule_check']['result']:
-        reason_details.append(f"规则检查: {info_result['rule_check']['reason']}")
-    if info_result['duplicate_check']['result']:
-        reason_details.append(f"重复性检查: {info_result['duplicate_check']['reason']}")
-    
+    reason_details = [f"{label}: {info_result[name]['reason']}"
+                      for name, label in ENTRY_LABELS.items() if entry_failed(name, info_result[name])]
     reason_text = "; ".join(reason_details) if reason_details else "所有检查均通过"
-    
-    # 创建Excel文件
+
     # 创建数据行
-    data = {
-        "分类": [classification2],
-        "产品URL": [webside],
-        "厂商": [manufacturer],
-        "规则内容": [query],
-        "是否录入": [main_true],
-        "原因": [reason_text]
+    row = {
+        "分类": classification2,
+        "产品URL": webside,
+        "厂商": manufacturer,
+        "规则内容": query,
+        "是否录入": main_true,
+        "原因": reason_text,
+        "跳过的检查": "; ".join(CHECK_LABELS[name] for name in skipped),
+        "FOFA请求数": cost['total']['fofa_requests'],
+        "F点消耗": cost['total']['fofa_fpoints'],
+        "下载字节数": cost['total']['fofa_bytes'] + cost['total']['crawl_bytes'],
+        "LLM token数": cost['total']['llm_prompt_tokens'] + cost['total']['llm_completion_tokens'],
+    }
+
+    return {
+        "row": row,
+        "main_true": main_true,
+        "info_result": info_result,
+        "skipped": skipped,
+        "timings": timings,
+        "metrics": cost
     }
-    
-    # 创建DataFrame
-    excel_file = "rule_check_result.xlsx"
-    df_new = pd.DataFrame(data)
-
-    if os.path.exists(excel_file):
-        # 读取已有内容
-        df_old = pd.read_excel(excel_file)
-        # 追加新内容
-        df_all = pd.concat([df_old, df_new], ignore_index=True)
-    else:
-        df_all = df_new
-
-    # 保存到同一个文件，覆盖写入
-    df_all.to_excel(excel_file, index=False)
-    print(f"结果已保存到Excel文件: {excel_file}")
-    
+
+def get_result_store(path=DEFAULT_STORE_PATH, legacy_excel=EXCEL_FILE):
+    """
+    获取结果存储，首次使用时导入旧版Excel结果文件中的已有内容
+    """
+    store = ResultStore(path)
+    if not store.exists() and os.path.exists(legacy_excel):
+        count = store.import_table(legacy_excel)
+        print(f"已从旧版结果文件 {legacy_excel} 导入 {count} 条结果")
+    return store
+
+def rule2excel(query, webside, manufacturer, classification1, classification2, full_report=False, export=None):
+    """
+    将所有规则信息转换为Excel格式
+
+    结果只追加写入结果存储，export指定文件路径时再导出一次结果文件；
+    逐条调用时不导出，需要时用 `python cli.py export` 或在批量处理结束后统一导出。
+    full_report为True时不短路，执行全部检查并记录所有原因
+    """
+    review = review_rule(query, webside, manufacturer, classification1, classification2, full_report=full_report)
+
+    # 追加写入结果，不重写已导出的文件
+    store = get_result_store()
+    store.append(review["row"])
+    excel_file = store.export(export) if export else None
+    write_metrics()
+
     return {
+        "store": store.path,
         "excel_file": excel_file,
-        "main_true": main_true,
-        "info_result": info_result
+        "main_true": review["main_true"],
+        "info_result": review["info_result"]
     }
 
 def main():
@@ -171,8 +311,9 @@ def main():
     classification1 = '物联网设备'
     classification2 = '视频监控'
 
-    res = rule2excel(query, webside, manufacturer, classification1, classification2)
+    res = rule2excel(query, webside, manufacturer, classification1, classification2, export=EXCEL_FILE)
     print("文件书写完成:", res)
+    print("LLM缓存统计:", cache_report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
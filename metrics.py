@@ -0,0 +1,286 @@
+"""
+规则审核的成本统计：FOFA请求次数、下载字节数、F点消耗、网页爬取、LLM调用次数和token数，
+以及各类请求的耗时直方图。
+
+统计按检查阶段（duplicate_check / info_check / rule_check）分标签记录，同时写入
+进程级汇总和当前规则的统计；当前规则和阶段通过contextvars传递，线程池和asyncio任务中同样生效。
+汇总结果可导出为Prometheus文本格式或JSON文件。
+
+用法:
+    with collect() as rule_metrics:
+        with stage('rule_check'):
+            ...
+    rule_metrics.summary()
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+# 耗时直方图的桶上界，单位秒
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+# 指标说明，用于Prometheus导出的HELP行
+METRIC_HELP = {
+    'fofa_requests_total': "FOFA API请求次数",
+    'fofa_errors_total': "FOFA API请求失败次数",
+    'fofa_cache_hits_total': "FOFA响应缓存命中次数",
+    'fofa_bytes_total': "FOFA API响应字节数",
+    'fofa_fpoints_total': "FOFA API消耗的F点",
+    'fofa_request_seconds': "FOFA API请求耗时",
+    'crawl_requests_total': "官网爬取请求次数",
+    'crawl_bytes_total': "官网爬取下载字节数",
+    'crawl_request_seconds': "官网爬取耗时",
+    'llm_requests_total': "LLM请求次数",
+    'llm_cache_hits_total': "LLM响应缓存命中次数",
+    'llm_prompt_tokens_total': "LLM提示词token数",
+    'llm_completion_tokens_total': "LLM生成token数",
+    'llm_request_seconds': "LLM请求耗时",
+}
+
+_current = contextvars.ContextVar('rule_metrics', default=None)
+_stage = contextvars.ContextVar('metrics_stage', default='other')
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    一组计数器和直方图，键为 (指标名, ((标签名, 标签值), ...))
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def total(self, name, **labels):
+        """
+        对满足标签条件的计数器求和
+        """
+        with self._lock:
+            return sum(value for (metric, metric_labels), value in self.counters.items()
+                       if metric == name and all(dict(metric_labels).get(k) == v for k, v in labels.items()))
+
+    def summary(self):
+        """
+        按阶段汇总的成本概览，用于写入结果记录和打印
+        """
+        with self._lock:
+            stages = sorted({dict(labels).get('stage', 'other') for _, labels in self.counters})
+        result = {}
+        for name in stages + [None]:
+            labels = {'stage': name} if name else {}
+            result[name or 'total'] = {
+                'fofa_requests': self.total('fofa_requests_total', **labels),
+                'fofa_cache_hits': self.total('fofa_cache_hits_total', **labels),
+                'fofa_bytes': self.total('fofa_bytes_total', **labels),
+                'fofa_fpoints': self.total('fofa_fpoints_total', **labels),
+                'crawl_bytes': self.total('crawl_bytes_total', **labels),
+                'llm_requests': self.total('llm_requests_total', **labels),
+                'llm_cache_hits': self.total('llm_cache_hits_total', **labels),
+                'llm_prompt_tokens': self.total('llm_prompt_tokens_total', **labels),
+                'llm_completion_tokens': self.total('llm_completion_tokens_total', **labels),
+            }
+        return result
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'buckets': {str(bound): count for bound, count in zip(h.buckets, h.counts)},
+                    'sum': round(h.sum, 6),
+                    'count': h.count,
+                } for (name, labels), h in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        """
+        输出Prometheus文本格式，直方图的桶为累计计数
+        """
+        def format_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        described = set()
+        for (name, labels), value in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), h in histograms:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                le = '+Inf' if math.isinf(bound) else str(bound)
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+
+# 进程级汇总，批量审核结束时导出
+GLOBAL = Metrics()
+
+
+def _targets():
+    current = _current.get()
+    return (GLOBAL, current) if current is not None else (GLOBAL,)
+
+
+def incr(name, value=1, **labels):
+    labels.setdefault('stage', _stage.get())
+    for metrics in _targets():
+        metrics.incr(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    labels.setdefault('stage', _stage.get())
+    for metrics in _targets():
+        metrics.observe(name, value, **labels)
+
+
+@contextmanager
+def collect():
+    """
+    为当前规则新建一组统计，期间的记录同时写入该组和进程级汇总
+    """
+    metrics = Metrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    标记当前检查阶段，期间的记录带上stage标签
+    """
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def record_fofa(endpoint, seconds, nbytes=0, fpoints=0, error=False):
+    incr('fofa_requests_total', endpoint=endpoint)
+    observe('fofa_request_seconds', seconds, endpoint=endpoint)
+    if nbytes:
+        incr('fofa_bytes_total', nbytes, endpoint=endpoint)
+    if fpoints:
+        incr('fofa_fpoints_total', fpoints, endpoint=endpoint)
+    if error:
+        incr('fofa_errors_total', endpoint=endpoint)
+
+
+def record_fofa_cache_hit(endpoint):
+    incr('fofa_cache_hits_total', endpoint=endpoint)
+
+
+def record_crawl(seconds, nbytes):
+    incr('crawl_requests_total')
+    incr('crawl_bytes_total', nbytes)
+    observe('crawl_request_seconds', seconds)
+
+
+def record_llm(seconds, prompt_tokens=0, completion_tokens=0, calls=1):
+    incr('llm_requests_total', calls)
+    incr('llm_prompt_tokens_total', prompt_tokens)
+    incr('llm_completion_tokens_total', completion_tokens)
+    observe('llm_request_seconds', seconds)
+
+
+def record_llm_cache_hit(count=1):
+    incr('llm_cache_hits_total', count)
+
+
+def write_metrics(path=None, metrics=None):
+    """
+    导出统计结果，.json后缀输出JSON，其他后缀输出Prometheus文本格式
+
+    Args:
+        path: 输出文件路径，默认读取环境变量METRICS_PATH，均未指定时不导出
+        metrics: 要导出的统计，默认为进程级汇总
+    """
+    path = path or os.getenv('METRICS_PATH')
+    if not path:
+        return None
+    metrics = metrics or GLOBAL
+    if path.lower().endswith('.json'):
+        content = json.dumps(metrics.to_dict(), ensure_ascii=False, indent=2)
+    else:
+        content = metrics.to_prometheus()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    print(f"成本统计已导出到文件: {path}")
+    return path
+
+
+def format_summary(summary):
+    """
+    把summary()的结果格式化为可读的多行文本
+    """
+    lines = []
+    for name, s in summary.items():
+        lines.append(
+            f"{name}: FOFA请求 {s['fofa_requests']} 次(缓存命中 {s['fofa_cache_hits']}), "
+            f"下载 {s['fofa_bytes'] / 1024:.1f} KB, F点 {s['fofa_fpoints']}, "
+            f"网页爬取 {s['crawl_bytes'] / 1024:.1f} KB, "
+            f"LLM请求 {s['llm_requests']} 次(缓存命中 {s['llm_cache_hits']}), "
+            f"token {s['llm_prompt_tokens']}+{s['llm_completion_tokens']}"
+        )
+    return '\n'.join(lines)
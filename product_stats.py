@@ -0,0 +1,165 @@
+"""
+产品级统计缓存：记录 app="产品名" 的资产总数，供反向查重复用
+
+同一批次中很多规则的排名最高产品相同，按产品名缓存后反向查重不再重复消耗
+每5秒一次的统计接口配额。缓存保存在SQLite文件中，多个工作进程共享。
+
+用法（预热已知产品，每行一个产品名）:
+    python product_stats.py products.txt
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from cache import SQLiteCache
+from config import load_env
+
+# 默认配置，可用环境变量PRODUCT_STATS_CACHE_PATH、PRODUCT_STATS_TTL覆盖，在创建共享实例时读取
+CACHE_PATH = os.path.join('.cache', 'product_stats.sqlite3')
+CACHE_MAX_ENTRIES = 50000
+# 产品总数变化较慢，默认7天内直接使用缓存
+FRESH_SECONDS = 7 * 24 * 3600
+
+
+def product_query(product_name):
+    """
+    构造产品的FOFA查询语句
+    """
+    escaped = product_name.replace('\\', '\\\\').replace('"', '\\"')
+    return f'app="{escaped}"'
+
+
+class ProductStatsCache:
+    """
+    按产品名缓存FOFA统计结果
+
+    Args:
+        cache: 持久化缓存，为None时只在进程内去重
+        fresh_seconds: 缓存有效时间，超过后重新查询
+    """
+
+    def __init__(self, cache=None, fresh_seconds=FRESH_SECONDS):
+        self.cache = cache
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def cached(self, product_name):
+        """
+        读取未过期的缓存，不存在时返回None
+        """
+        if self.cache is None:
+            return None
+        return self.cache.get(product_name, ttl=self.fresh_seconds)
+
+    def _fetch(self, product_name):
+        from API import fofa_stats
+
+        # 统计接口的通用缓存与本缓存的有效期不同，这里总是取最新数据
+        json_data = fofa_stats(product_query(product_name), refresh=True)
+        if json_data.get('error') and json_data.get('error') != 'false':
+            return {'error': json_data.get('errmsg') or json_data['error'], 'size': 0}
+        result = {'error': False, 'size': json_data.get('size', 0), 'fetched': time.time()}
+        if self.cache is not None:
+            self.cache.set(product_name, result)
+        return result
+
+    def get(self, product_name, refresh=False):
+        """
+        获取产品统计，结果至少包含size字段；查询失败时返回带error字段的字典且不缓存
+
+        同一产品同时只会发出一个统计请求，其余调用方等待其结果
+        """
+        if not refresh:
+            cached = self.cached(product_name)
+            if cached is not None:
+                return cached
+
+        with self._lock:
+            future = self._in_flight.get(product_name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[product_name] = future
+
+        if owner:
+            try:
+                future.set_result(self._fetch(product_name))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(product_name, None)
+        return future.result()
+
+    def warm(self, product_names, refresh=False):
+        """
+        预热产品统计，已有未过期缓存的产品跳过
+
+        Returns:
+            {'fetched': 新查询数, 'skipped': 跳过数, 'failed': 失败的产品列表}
+        """
+        summary = {'fetched': 0, 'skipped': 0, 'failed': []}
+        for name in dict.fromkeys(n.strip() for n in product_names if n and n.strip()):
+            if not refresh and self.cached(name) is not None:
+                summary['skipped'] += 1
+                continue
+            result = self.get(name, refresh=True)
+            if result.get('error'):
+                summary['failed'].append(name)
+                print(f"产品 {name} 统计失败: {result['error']}")
+            else:
+                summary['fetched'] += 1
+                print(f"产品 {name}: {result['size']}")
+        return summary
+
+
+_product_stats = None
+_product_stats_lock = threading.Lock()
+
+
+def get_product_stats():
+    """
+    获取共享的ProductStatsCache实例，设置环境变量PRODUCT_STATS_CACHE=0可关闭持久化缓存
+    """
+    global _product_stats
+    if _product_stats is None:
+        with _product_stats_lock:
+            if _product_stats is None:
+                load_env()
+                cache = None
+                if os.getenv('PRODUCT_STATS_CACHE', '1') != '0':
+                    path = os.getenv('PRODUCT_STATS_CACHE_PATH', CACHE_PATH)
+                    cache = SQLiteCache(path, max_entries=CACHE_MAX_ENTRIES)
+                fresh_seconds = int(os.getenv('PRODUCT_STATS_TTL', str(FRESH_SECONDS)))
+                _product_stats = ProductStatsCache(cache=cache, fresh_seconds=fresh_seconds)
+    return _product_stats
+
+
+def product_stats(product_name, refresh=False):
+    return get_product_stats().get(product_name, refresh=refresh)
+
+
+def add_arguments(parser):
+    parser.add_argument('products', help="产品名列表文件，每行一个产品名")
+    parser.add_argument('--refresh', action='store_true', help="忽略已有缓存，全部重新查询")
+
+
+def warm_file(path, refresh=False):
+    with open(path, encoding='utf-8') as f:
+        summary = get_product_stats().warm(f, refresh=refresh)
+    print(f"预热完成: 新查询 {summary['fetched']}，跳过 {summary['skipped']}，失败 {len(summary['failed'])}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预热产品统计缓存")
+    add_arguments(parser)
+    args = parser.parse_args()
+    warm_file(args.products, refresh=args.refresh)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+按token预算打包提示词输入：本地分词计数，合并近似重复的条目，
+优先放入出现次数多、信息量大的条目，并记录放入和丢弃的条目数。
+"""
+import re
+from functools import lru_cache
+
+DEFAULT_SIMILARITY = 0.9  # 判定为近似重复的Jaccard相似度阈值
+MIN_ITEM_TOKENS = 32  # 截断后少于该token数的条目不再放入
+OMITTED_NOTE_TOKENS = 40  # 为“未列出条目”说明行预留的token数
+
+_WORD_RE = re.compile(r'[一-鿿]|[A-Za-z0-9_.\-/]+')
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """
+    使用本地分词器统计token数，tiktoken不可用时按字符粗略估算
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    """
+    截断文本使其不超过max_tokens个token
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+    while text and count_tokens(text) > max_tokens:
+        text = text[:int(len(text) * max_tokens / count_tokens(text)) - 1]
+    return text
+
+
+def _shingles(text, size=3):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def pack_items(items, budget, similarity=DEFAULT_SIMILARITY, label=''):
+    """
+    将条目列表打包为不超过budget个token的文本
+
+    近似重复的条目合并为一条并标注出现次数（[×k]），保留各类型的数量比例；
+    按出现次数和信息量从高到低放入，放不下的条目截断或丢弃。
+    有条目被丢弃时末尾追加一行说明未列出的条数，保证按总数计算比例时分母不变。
+
+    Args:
+        items: 字符串列表
+        budget: token预算
+        similarity: 近似重复判定阈值
+        label: 日志中使用的槽位名
+
+    Returns:
+        (打包后的文本, 统计信息字典)
+    """
+    items = [str(item) for item in items if item is not None and str(item).strip()]
+
+    # 近似重复聚类：每个条目并入第一个足够相似的组
+    groups = []
+    for item in items:
+        shingles = _shingles(item)
+        for group in groups:
+            if _jaccard(shingles, group['shingles']) >= similarity:
+                group['count'] += 1
+                break
+        else:
+            groups.append({'text': item, 'shingles': shingles, 'count': 1})
+
+    # 出现次数多的类型优先，其次是信息量（不同词片段数）大的
+    groups.sort(key=lambda g: (g['count'], len(g['shingles'])), reverse=True)
+
+    candidates = []
+    for group in groups:
+        prefix = f"[×{group['count']}] " if group['count'] > 1 else ''
+        line = prefix + group['text']
+        candidates.append((group, line, count_tokens(line)))
+
+    # 放不下全部条目时为末尾的说明行预留预算
+    limit = budget
+    if sum(tokens for _, _, tokens in candidates) > budget:
+        limit = max(budget - OMITTED_NOTE_TOKENS, 0)
+
+    lines = []
+    used = 0
+    included = 0
+    truncated = 0
+    omitted_groups = []
+    for group, line, tokens in candidates:
+        remaining = limit - used
+        if tokens > remaining:
+            if remaining < MIN_ITEM_TOKENS:
+                omitted_groups.append(group)
+                continue
+            line = truncate_tokens(line, remaining)
+            tokens = count_tokens(line)
+            truncated += 1
+        lines.append(line)
+        used += tokens
+        included += group['count']
+
+    if omitted_groups:
+        omitted = sum(group['count'] for group in omitted_groups)
+        largest = max(group['count'] for group in omitted_groups)
+        note = (f"[另有{omitted}条内容未列出，分属{len(omitted_groups)}类，每类最多{largest}条，"
+                f"统计比例时需计入总数{len(items)}条]")
+        lines.append(note)
+        used += count_tokens(note)
+
+    stats = {
+        'items': len(items),
+        'unique': len(groups),
+        'included': included,
+        'dropped': len(items) - included,
+        'truncated': truncated,
+        'tokens': used,
+        'budget': budget,
+    }
+    if label:
+        print(f"提示词打包[{label}]: 共{stats['items']}条, 去重后{stats['unique']}条, "
+              f"放入{stats['included']}条, 丢弃{stats['dropped']}条, 截断{stats['truncated']}条, "
+              f"{stats['tokens']}/{budget} tokens")
+    return '\n'.join(lines), stats
+
+
+def pack_text(text, budget, label=''):
+    """
+    将单段文本截断到budget个token以内
+    """
+    text = text or ''
+    packed = truncate_tokens(text, budget)
+    if label:
+        print(f"提示词打包[{label}]: {count_tokens(packed)}/{budget} tokens"
+              + (" (已截断)" if packed != text else ""))
+    return packed
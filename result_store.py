@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+DEFAULT_STORE_PATH = "rule_check_result.jsonl"
+
+
+class ResultStore:
+    """
+    只追加写入的审核结果存储，每条结果写入JSONL文件的一行
+
+    每次写入只追加一行并立即落盘，写入中途崩溃最多损坏最后一行，
+    读取时会跳过不完整的行。需要表格文件时调用export一次性导出。
+
+    Args:
+        path: JSONL文件路径
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def append(self, row):
+        """
+        追加一条结果
+        """
+        self.extend([row])
+
+    def extend(self, rows):
+        """
+        追加多条结果
+        """
+        lines = ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self):
+        """
+        读取全部结果，跳过因崩溃而不完整的行
+        """
+        rows = []
+        if not os.path.exists(self.path):
+            return rows
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"跳过不完整的结果行: {line[:100]}")
+        return rows
+
+    def export(self, output="rule_check_result.xlsx"):
+        """
+        将全部结果一次性导出为xlsx/csv/parquet文件，按扩展名选择格式
+
+        先写入临时文件再替换目标文件，导出中途失败不会破坏已有文件。
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(self.read())
+        ext = os.path.splitext(output)[1].lower()
+        tmp = output + '.tmp'
+        if ext == '.csv':
+            df.to_csv(tmp, index=False, encoding='utf-8-sig')
+        elif ext == '.parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise ImportError("导出Parquet需要安装pyarrow (pip install pyarrow)，或改用xlsx/csv") from e
+            df.to_parquet(tmp, index=False)
+        elif ext in ('.xlsx', '.xlsm'):
+            df.to_excel(tmp, index=False, engine='openpyxl')
+        else:
+            raise ValueError(f"不支持的导出文件类型: {ext}")
+        os.replace(tmp, output)
+        print(f"结果已导出到文件: {output} (共 {len(df)} 条)")
+        return output
+
+    def import_table(self, path):
+        """
+        将旧版Excel/CSV结果文件导入存储，用于从读写整个Excel的旧流程迁移
+        """
+        import pandas as pd
+
+        if path.lower().endswith('.csv'):
+            df = pd.read_csv(path)
+        else:
+            df = pd.read_excel(path)
+        rows = df.where(df.notna(), None).to_dict('records')
+        self.extend(rows)
+        return len(rows)
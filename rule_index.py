@@ -0,0 +1,160 @@
+"""
+已收录规则的本地倒排索引：把每条规则拆成规范化的 字段=值 原子
+（如 body="js/validator.js"、banner="zxr10"），新规则按共享原子找出可能重叠的产品，
+相似度足够高时直接判为重复，其余情况仍调用FOFA统计接口。规则库只覆盖已收录的规则，
+与库中规则没有交集不代表与FOFA中的产品不重叠，因此默认不据此判为不重复；
+设置环境变量RULE_INDEX_TRUST_UNIQUE=1后，相似度很低的规则也直接判为不重复。
+
+规则库文件为CSV/XLSX/JSONL，需包含产品名和规则内容两列，路径通过环境变量RULE_CORPUS_PATH指定。
+"""
+import math
+import os
+import threading
+from collections import defaultdict
+
+from fofa_query import parse, iter_conditions, QueryError
+
+PRODUCT_ALIASES = ['product', 'app', '产品', '产品名', '产品名称']
+
+DUPLICATE_SCORE = 0.8  # 与已有规则相似度不低于该值时直接判为重复
+UNIQUE_SCORE = 0.1  # 开启trust_unique时，所有已有规则的相似度都低于该值则直接判为不重复
+
+
+def extract_atoms(query):
+    """
+    提取规则中的肯定条件原子，返回 {(字段, 值)}；!= 条件不表示特征，不参与索引
+    """
+    try:
+        node = parse(query)
+    except QueryError:
+        return set()
+    atoms = set()
+    for cond in iter_conditions(node):
+        value = cond.value.strip().lower()
+        if value:
+            atoms.add((cond.field, value))
+    return atoms
+
+
+def format_atom(atom):
+    field, value = atom
+    return f'{field}="{value}"'
+
+
+class RuleIndex:
+    """
+    规则原子的倒排索引，原子按逆文档频率加权，常见原子（如 title="login"）权重较低
+
+    Args:
+        trust_unique: 为True时相似度很低的规则直接判为不重复，默认只由索引判定重复
+    """
+
+    def __init__(self, trust_unique=False):
+        self.trust_unique = trust_unique
+        self.rules = []  # [(产品名, 规则, 原子集合)]
+        self.postings = defaultdict(set)  # 原子 -> 规则编号
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, product, query):
+        atoms = extract_atoms(query)
+        if not atoms:
+            return
+        rule_id = len(self.rules)
+        self.rules.append((product, query, atoms))
+        for atom in atoms:
+            self.postings[atom].add(rule_id)
+
+    def weight(self, atom):
+        """
+        原子的逆文档频率权重，索引中未出现的原子按最稀有处理
+        """
+        return math.log(1 + (len(self.rules) + 1) / (len(self.postings.get(atom, ())) + 1))
+
+    def candidates(self, query, top_k=5):
+        """
+        返回与规则共享原子的已有规则，按加权Jaccard相似度降序，同一产品只保留最相似的一条
+
+        Returns:
+            [{'product', 'rule', 'score', 'shared'}]
+        """
+        atoms = extract_atoms(query)
+        rule_ids = set()
+        for atom in atoms:
+            rule_ids |= self.postings.get(atom, set())
+
+        best = {}
+        for rule_id in rule_ids:
+            product, rule, rule_atoms = self.rules[rule_id]
+            shared = atoms & rule_atoms
+            score = sum(map(self.weight, shared)) / sum(map(self.weight, atoms | rule_atoms))
+            if product not in best or score > best[product]['score']:
+                best[product] = {
+                    'product': product,
+                    'rule': rule,
+                    'score': round(score, 4),
+                    'shared': sorted(format_atom(atom) for atom in shared),
+                }
+        return sorted(best.values(), key=lambda c: c['score'], reverse=True)[:top_k]
+
+    def decide(self, query, top_k=5):
+        """
+        根据索引判断规则是否与已有规则重复
+
+        Returns:
+            {'decision': 'duplicate' / 'unique' / None, 'candidates': [...]}，
+            decision为None时表示索引无法判断，需要调用FOFA统计接口
+        """
+        if not self.rules or not extract_atoms(query):
+            return {'decision': None, 'candidates': []}
+        candidates = self.candidates(query, top_k=top_k)
+        top_score = candidates[0]['score'] if candidates else 0.0
+        decision = None
+        if top_score >= DUPLICATE_SCORE:
+            decision = 'duplicate'
+        elif self.trust_unique and top_score < UNIQUE_SCORE:
+            decision = 'unique'
+        return {'decision': decision, 'candidates': candidates}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        从 {列名: 值} 行构建索引，缺少产品名或规则内容的行跳过
+        """
+        from batch import COLUMN_ALIASES
+
+        index = cls()
+        for raw in rows:
+            product = next((raw[a] for a in PRODUCT_ALIASES if raw.get(a) not in (None, '')), None)
+            query = next((raw[a] for a in COLUMN_ALIASES['query'] if raw.get(a) not in (None, '')), None)
+            if product and query:
+                index.add(str(product).strip(), str(query).strip())
+        return index
+
+    @classmethod
+    def from_file(cls, path):
+        from batch import iter_raw_rows
+        return cls.from_rows(iter_raw_rows(path))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_rule_index():
+    """
+    获取共享的规则索引，首次调用时从RULE_CORPUS_PATH加载；未配置规则库时返回None
+    """
+    global _index
+    path = os.getenv('RULE_CORPUS_PATH', '')
+    if _index is None and path:
+        with _index_lock:
+            if _index is None:
+                if not os.path.exists(path):
+                    print(f"警告: 规则库文件不存在: {path}")
+                    return None
+                _index = RuleIndex.from_file(path)
+                _index.trust_unique = os.getenv('RULE_INDEX_TRUST_UNIQUE', '0') == '1'
+                print(f"已加载规则库索引: {len(_index)} 条规则")
+    return _index
@@ -0,0 +1,127 @@
+"""
+自适应分轮抽样：按分层方式在全部结果页中选页，每轮抽样后用Wilson置信区间估计
+最多同类内容占比，区间明确高于或低于阈值时提前停止，减少FOFA查询和LLM输入。
+"""
+import math
+import random
+
+DEFAULT_THRESHOLD = 0.7  # 与规则准确性判定的同一类型比例阈值一致
+DEFAULT_CONFIDENCE_Z = 1.96  # 95%置信水平
+
+
+def wilson_interval(successes, n, z=DEFAULT_CONFIDENCE_Z):
+    """
+    二项比例的Wilson置信区间，n为0时返回(0.0, 1.0)
+    """
+    if n <= 0:
+        return 0.0, 1.0
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def stratified_pages(last_page, strata, rng, first_page=1):
+    """
+    把 [first_page, last_page] 均分为strata层，每层随机取一页，保证覆盖到最后一页所在的层
+
+    Returns:
+        升序页码列表，页数不超过层数和可选页数
+    """
+    count = last_page - first_page + 1
+    if count <= 0 or strata <= 0:
+        return []
+    strata = min(strata, count)
+    pages = []
+    for i in range(strata):
+        start = first_page + i * count // strata
+        end = first_page + (i + 1) * count // strata - 1
+        pages.append(rng.randint(start, end))
+    return pages
+
+
+class AdaptiveSampler:
+    """
+    单类内容（banner或body）的分轮抽样器
+
+    第1页作为探测页必取，其余页从第2页到最后一页分层选取，按随机顺序分轮请求；
+    每轮结束后由调用方传入累计样本的分组结果，区间判定完成或页数用尽时停止。
+    结果数小于full_below时不抽样也不分页，由调用方用一次请求取回全部结果。
+
+    Args:
+        total: 查询结果总数
+        max_pages: 最多抽取的页数（含第1页）
+        pages_per_round: 每轮请求的页数
+        page_size: 每页条数
+        threshold: 最多同类内容占比的判定阈值
+        min_items: 至少获取多少条样本后才允许提前停止
+        full_below: 结果数小于该值时进入全量模式，不生成抽样页
+        rng: random.Random实例，传入带种子的实例可复现抽样页
+    """
+
+    def __init__(self, total, max_pages, pages_per_round=1, page_size=10, threshold=DEFAULT_THRESHOLD,
+                 min_items=20, full_below=0, rng=None):
+        self.total = total
+        self.threshold = threshold
+        self.min_items = min_items
+        self.pages_per_round = max(1, pages_per_round)
+        self.last_page = (total + page_size - 1) // page_size
+        self.interval = (0.0, 1.0)
+        self.majority = 0
+        self.sampled = 0
+        self.verdict = None  # 'above' / 'below' / None
+
+        rng = rng or random.Random()
+        if total < full_below:
+            self.exhaustive = True
+            self.plan = []
+        else:
+            self.exhaustive = False
+            self.plan = stratified_pages(self.last_page, max_pages - 1, rng, first_page=2)
+            rng.shuffle(self.plan)
+        self.requested = [1] if self.last_page >= 1 else []
+
+    def next_pages(self):
+        """
+        返回下一轮需要请求的页码，已停止或页数用尽时返回空列表
+        """
+        if self.verdict is not None:
+            return []
+        pages, self.plan = self.plan[:self.pages_per_round], self.plan[self.pages_per_round:]
+        self.requested.extend(pages)
+        return pages
+
+    def update(self, groups):
+        """
+        根据累计样本的分组更新置信区间
+
+        Args:
+            groups: 累计样本的分组，如 [[0, 2, 5], [1, 4], [3]]
+
+        Returns:
+            当前判定结果，'above' / 'below' / None
+        """
+        self.sampled = sum(len(group) for group in groups)
+        self.majority = max((len(group) for group in groups), default=0)
+        self.interval = wilson_interval(self.majority, self.sampled)
+        if not self.exhaustive and self.sampled >= self.min_items:
+            low, high = self.interval
+            if low > self.threshold:
+                self.verdict = 'above'
+            elif high < self.threshold:
+                self.verdict = 'below'
+        return self.verdict
+
+    def report(self):
+        low, high = self.interval
+        return {
+            'total': self.total,
+            'pages': sorted(self.requested),
+            'sampled': self.sampled,
+            'majority_ratio': round(self.majority / self.sampled, 4) if self.sampled else 0.0,
+            'interval': (round(low, 4), round(high, 4)),
+            'verdict': self.verdict,
+            'exhaustive': self.exhaustive,
+            'stopped_early': bool(self.verdict and self.plan),
+        }
@@ -0,0 +1,374 @@
+"""
+基于FOFA流式查询的导出管道：逐行解码响应，产出类型化记录，
+经过可插拔的过滤、按host去重等阶段后分块写入JSONL或Parquet。
+
+整个管道由生成器串联，只有下游消费时才从网络读取数据，
+写入变慢时读取也随之放缓（TCP背压）。按host去重时已出现的host摘要保存在
+输出旁的SQLite文件中而不是内存里，因此无论是否去重，内存占用都只与分块大小有关；
+去重文件的磁盘占用随不同host数增长，每个约十几字节。
+连接中断时自动重连并跳过已产出的记录；写入检查点后进程重启也可续传。
+
+用法:
+    python stream_export.py 'app="Apache-Tomcat"' tomcat.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import NamedTuple
+
+import requests
+
+from API import get_client
+
+STREAM_FIELDS = ('host', 'title', 'header', 'product')
+DEFAULT_CHUNK_SIZE = 5000
+HOST_COMMIT_EVERY = 10000  # 去重集合每加入多少个host提交一次
+
+
+class StreamRecord(NamedTuple):
+    host: str
+    title: str
+    header: str
+    product: str
+
+
+class StreamError(Exception):
+    pass
+
+
+def parse_record(line, fields=STREAM_FIELDS):
+    """
+    将流式响应中的一行解码为StreamRecord，无法解析的行返回None
+
+    兼容每行为JSON数组（按fields顺序）、JSON对象或制表符分隔文本的格式。
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='replace')
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        data = line.split('\t')
+    if isinstance(data, dict):
+        if data.get('error'):
+            raise StreamError(data.get('errmsg') or str(data))
+        values = [data.get(field, '') for field in fields]
+    elif isinstance(data, list):
+        values = list(data)
+    else:
+        return None
+    values = (values + [''] * len(STREAM_FIELDS))[:len(STREAM_FIELDS)]
+    return StreamRecord(*[value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+                          for value in values])
+
+
+class FofaStream:
+    """
+    可续传的FOFA流式查询记录源
+
+    position记录已产出的记录数；连接中断后重新发起查询并跳过前position条记录。
+
+    Args:
+        query: FOFA查询语句
+        start: 起始位置，续传时传入检查点中的位置
+        max_retries: 连续重连的最大次数
+        backoff: 首次重连前的等待秒数，之后每次翻倍
+    """
+
+    def __init__(self, query, start=0, max_retries=5, backoff=2.0, timeout=(5, 120)):
+        self.query = query
+        self.position = start
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def __iter__(self):
+        retries = 0
+        while True:
+            skip = self.position
+            try:
+                response = get_client().stream_response(
+                    self.query, fields=','.join(STREAM_FIELDS), timeout=self.timeout
+                )
+                with response:
+                    if response.status_code != 200:
+                        raise StreamError(f"Request failed with status code {response.status_code}")
+                    for line in response.iter_lines(chunk_size=64 * 1024):
+                        record = parse_record(line)
+                        if record is None:
+                            continue
+                        if skip:
+                            skip -= 1
+                            continue
+                        self.position += 1
+                        retries = 0
+                        yield record
+                return
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.Timeout) as e:
+                retries += 1
+                if retries > self.max_retries:
+                    raise StreamError(f"流式查询重连{self.max_retries}次后仍失败: {e}") from e
+                wait = self.backoff * 2 ** (retries - 1)
+                print(f"流式查询连接中断({e})，{wait:.0f}秒后从第{self.position}条继续")
+                time.sleep(wait)
+
+
+# ---------- 可插拔的处理阶段 ----------
+
+def filter_records(records, predicate):
+    """
+    只保留predicate返回True的记录
+    """
+    return (record for record in records if predicate(record))
+
+
+def host_key(host):
+    """
+    host的8字节摘要，转为有符号64位整数以便作为SQLite的整数主键
+    """
+    digest = hashlib.blake2b(host.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class HostSet:
+    """
+    保存在SQLite文件中的host摘要集合，内存占用与host数量无关
+
+    只用于单次导出的去重，每次打开时清空；续传时由调用方根据已写入的输出重建。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.remove()
+        self.conn = sqlite3.connect(path)
+        # 集合可随时从输出重建，不需要日志和同步落盘
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE hosts (key INTEGER PRIMARY KEY)")
+        self._pending = 0
+
+    def add(self, host):
+        """
+        加入host，之前不存在时返回True
+        """
+        cursor = self.conn.execute("INSERT OR IGNORE INTO hosts (key) VALUES (?)", (host_key(host),))
+        self._pending += 1
+        if self._pending >= HOST_COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+        return cursor.rowcount == 1
+
+    def update(self, hosts):
+        self.conn.executemany("INSERT OR IGNORE INTO hosts (key) VALUES (?)", ((host_key(h),) for h in hosts))
+        self.conn.commit()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        self.conn.close()
+        self.remove()
+
+
+def dedupe_hosts(records, seen=None):
+    """
+    按host去重
+
+    Args:
+        seen: 已出现的host集合，需提供返回是否新加入的add方法；为None时使用内存集合，
+            内存占用随不同host数增长，只适合结果较少的场景
+    """
+    if seen is None:
+        memory = set()
+
+        def add(host):
+            key = host_key(host)
+            if key in memory:
+                return False
+            memory.add(key)
+            return True
+    else:
+        add = seen.add
+    for record in records:
+        if add(record.host):
+            yield record
+
+
+def chunked(records, size=DEFAULT_CHUNK_SIZE):
+    """
+    将记录按size条分块
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------- 分块写入 ----------
+
+class JSONLWriter:
+    """
+    追加写入JSONL文件，每块写完后落盘
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, chunk):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in chunk:
+                f.write(json.dumps(record._asdict(), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_hosts(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)['host']
+                except (json.JSONDecodeError, KeyError):
+                    continue
+
+
+class ParquetWriter:
+    """
+    每块写成目录下的一个Parquet分片文件，续传时只会新增分片
+    """
+
+    def __init__(self, directory):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("导出Parquet需要安装pyarrow (pip install pyarrow)，或改用.jsonl输出") from e
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.parquet'))
+
+    def reset(self):
+        for name in self._parts():
+            os.remove(os.path.join(self.directory, name))
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist([record._asdict() for record in chunk])
+        path = os.path.join(self.directory, f"part-{len(self._parts()):05d}.parquet")
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def iter_hosts(self):
+        import pyarrow.parquet as pq
+
+        for name in self._parts():
+            for host in pq.read_table(os.path.join(self.directory, name), columns=['host']).column('host'):
+                yield host.as_py()
+
+
+def open_writer(output):
+    if output.endswith('.jsonl'):
+        return JSONLWriter(output)
+    return ParquetWriter(output)
+
+
+# ---------- 检查点 ----------
+
+def load_checkpoint(path, query):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    return checkpoint['position'] if checkpoint.get('query') == query else 0
+
+
+def save_checkpoint(path, query, position):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'query': query, 'position': position}, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def export_stream(query, output, chunk_size=DEFAULT_CHUNK_SIZE, dedupe=True, predicate=None, resume=True):
+    """
+    将FOFA流式查询结果导出到文件
+
+    Args:
+        query: FOFA查询语句
+        output: 以.jsonl结尾时写JSONL文件，否则视为Parquet分片目录
+        chunk_size: 每块记录数，同时也是检查点的粒度
+        dedupe: 是否按host去重，已出现的host摘要保存在输出旁的 .hosts.sqlite3 文件中
+        predicate: 可选的过滤函数，接收StreamRecord
+        resume: 是否从检查点续传
+
+    Returns:
+        {'read': 读取的记录数, 'written': 写入的记录数}
+    """
+    writer = open_writer(output)
+    checkpoint_path = output.rstrip('/\\') + '.checkpoint'
+    start = load_checkpoint(checkpoint_path, query) if resume else 0
+    if start:
+        print(f"从检查点续传，跳过前{start}条记录")
+    else:
+        writer.reset()
+
+    source = FofaStream(query, start=start)
+    records = iter(source)
+    if predicate is not None:
+        records = filter_records(records, predicate)
+    seen = None
+    if dedupe:
+        seen = HostSet(output.rstrip('/\\') + '.hosts.sqlite3')
+        if start:
+            # 按已写入的输出重建，与检查点保持一致
+            seen.update(writer.iter_hosts())
+        records = dedupe_hosts(records, seen=seen)
+
+    written = 0
+    try:
+        for chunk in chunked(records, chunk_size):
+            writer.write(chunk)
+            written += len(chunk)
+            save_checkpoint(checkpoint_path, query, source.position)
+            print(f"已读取 {source.position} 条, 已写入 {written} 条")
+    finally:
+        if seen is not None:
+            seen.close()
+
+    save_checkpoint(checkpoint_path, query, source.position)
+    return {'read': source.position - start, 'written': written}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FOFA流式查询导出")
+    parser.add_argument('query', help="FOFA查询语句")
+    parser.add_argument('output', help="输出文件(.jsonl)或Parquet分片目录")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--no-dedupe', action='store_true', help="不按host去重")
+    parser.add_argument('--restart', action='store_true', help="忽略检查点，从头导出")
+    args = parser.parse_args()
+
+    result = export_stream(args.query, args.output, chunk_size=args.chunk_size,
+                           dedupe=not args.no_dedupe, resume=not args.restart)
+    print(f"导出完成: {result}")
+
+
+if __name__ == "__main__":
+    main()
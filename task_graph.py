@@ -0,0 +1,94 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TaskGraph:
+    """
+    依赖感知的小型任务图执行器
+
+    每个任务在其依赖全部成功后提交到线程池执行，互不依赖的任务并发运行。
+    单个任务失败不会中断其他分支，只有依赖它的任务会被跳过。
+
+    用法:
+        graph = TaskGraph()
+        graph.add('a', fetch_a)
+        graph.add('b', fetch_b)
+        graph.add('c', lambda a, b: a + b, deps=('a', 'b'))
+        outcome = graph.run()
+        outcome['results']['c']
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, fn, deps=()):
+        """
+        登记任务，fn按deps顺序接收依赖任务的返回值
+        """
+        if name in self.tasks:
+            raise ValueError(f"任务重复登记: {name}")
+        self.tasks[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, max_workers=None):
+        """
+        执行全部任务
+
+        Returns:
+            {
+                'results': {任务名: 返回值},
+                'errors': {任务名: 异常},
+                'skipped': [因依赖失败而跳过的任务名],
+                'timings': {任务名: 耗时秒数},
+            }
+        """
+        for name, (_, deps) in self.tasks.items():
+            missing = [dep for dep in deps if dep not in self.tasks]
+            if missing:
+                raise ValueError(f"任务 {name} 依赖未登记的任务: {missing}")
+
+        results, errors, timings = {}, {}, {}
+        skipped = []
+        pending = dict(self.tasks)
+        running = {}
+
+        def timed(name, fn, args):
+            start = time.monotonic()
+            try:
+                return fn(*args)
+            finally:
+                timings[name] = time.monotonic() - start
+
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(self.tasks), 1)) as executor:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if any(dep in errors or dep in skipped for dep in deps):
+                        skipped.append(name)
+                        del pending[name]
+                    elif all(dep in results for dep in deps):
+                        args = [results[dep] for dep in deps]
+                        # 在提交时的上下文副本中执行，任务内可读取调用方设置的contextvars
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, timed, name, fn, args)] = name
+                        del pending[name]
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"任务图存在循环依赖: {list(pending)}")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = e
+
+        return {
+            'results': results,
+            'errors': errors,
+            'skipped': skipped,
+            'timings': timings,
+        }
@@ -0,0 +1,59 @@
+"""
+分类体系：启动后只加载一次classification.json，建立小类到大类的索引，
+用于本地校验(大类, 小类)组合并缩小提示词中的候选分类范围。
+"""
+import json
+import os
+from functools import lru_cache
+
+CLASSIFICATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classification.json')
+
+
+@lru_cache(maxsize=None)
+def load_taxonomy(path=CLASSIFICATION_PATH):
+    """
+    加载分类体系 {大类: [小类, ...]}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        taxonomy = json.load(f)
+    print(f"加载所有分类信息成功: {len(taxonomy)} 个大类")
+    return taxonomy
+
+
+@lru_cache(maxsize=None)
+def subclass_index(path=CLASSIFICATION_PATH):
+    """
+    建立小类到所属大类列表的索引，同名小类可能出现在多个大类下
+    """
+    index = {}
+    for major, subclasses in load_taxonomy(path).items():
+        for subclass in subclasses:
+            index.setdefault(subclass, []).append(major)
+    return index
+
+
+def validate_pair(classification1, classification2, path=CLASSIFICATION_PATH):
+    """
+    本地校验大类和小类的组合
+
+    Returns:
+        (是否有效, 无效时的原因)
+    """
+    taxonomy = load_taxonomy(path)
+    if classification1 not in taxonomy:
+        return False, f"大类\"{classification1}\"不在分类体系中"
+    if classification2 not in taxonomy[classification1]:
+        majors = subclass_index(path).get(classification2)
+        if majors:
+            return False, f"小类\"{classification2}\"不属于大类\"{classification1}\"，而属于大类: {'、'.join(majors)}"
+        return False, f"小类\"{classification2}\"不在分类体系中"
+    return True, None
+
+
+def candidate_taxonomy(classification1, classification2, path=CLASSIFICATION_PATH):
+    """
+    返回与给定分类相关的候选分类：给定大类，以及包含给定小类的其他大类
+    """
+    taxonomy = load_taxonomy(path)
+    majors = [classification1] + subclass_index(path).get(classification2, [])
+    return {major: taxonomy[major] for major in dict.fromkeys(majors) if major in taxonomy}
@@ -0,0 +1,75 @@
+import pytest
+
+from fofa_query import (
+    And, Condition, Or, QueryError, canonicalize, condition, iter_conditions, parse, restrict,
+)
+
+
+def test_whitespace_order_and_parentheses_are_canonicalized():
+    a = canonicalize('body="js/validator.js" && body="js/mootools.js" && title="IDC/ISP"')
+    b = canonicalize('  title="IDC/ISP"&&(body="js/mootools.js" && body="js/validator.js")')
+    assert a == b == 'body="js/mootools.js" && body="js/validator.js" && title="IDC/ISP"'
+
+
+def test_or_inside_and_keeps_parentheses():
+    assert canonicalize('((banner="ADC" || banner="AD")) && BANNER="aurora"') == \
+        '(banner="AD" || banner="ADC") && banner="aurora"'
+
+
+@pytest.mark.parametrize('query, value', [
+    (r'body="C:\Windows"', 'C:\\Windows'),
+    (r'body~="\d{3}-\w+"', '\\d{3}-\\w+'),
+    (r'title="a\"b"', 'a"b'),
+    (r'title="a\\b"', 'a\\b'),
+    (r'title="end\\"', 'end\\'),
+])
+def test_only_quote_and_backslash_are_escapes(query, value):
+    assert parse(query).value == value
+
+
+def test_other_backslashes_are_kept_as_written():
+    assert canonicalize(r'body="C:\Windows"') == r'body="C:\Windows"'
+    assert canonicalize(r'body~="\d{3}-\w+"') == r'body~="\d{3}-\w+"'
+
+
+def test_distinct_backslash_values_stay_distinct():
+    assert canonicalize(r'body="a\b"') != canonicalize('body="ab"')
+
+
+@pytest.mark.parametrize('query', [
+    r'body="C:\Windows" && title="x"',
+    r'body~="\d{3}-\w+" || banner="a\"b"',
+    r'title="a\\" && (port=80 || "nginx")',
+    r'header="x\\\"y" && header!="z"',
+    'a="x" || b="y" && c="z"',
+])
+def test_canonical_form_round_trips(query):
+    canonical = canonicalize(query)
+    assert canonicalize(canonical) == canonical
+    assert parse(canonical) == parse(query)
+
+
+def test_operators_and_bare_values():
+    node = parse('port=80 && title=="Login" && body*="abc" && header!="x"')
+    assert isinstance(node, And)
+    assert Condition('port', '=', '80') in node.items
+    assert Condition('title', '==', 'Login') in node.items
+    assert [c.field for c in iter_conditions(node)] == ['body', 'port', 'title']
+
+
+def test_or_has_lower_precedence_than_and():
+    node = parse('a="x" || b="y" && c="z"')
+    assert isinstance(node, Or)
+    assert And((Condition('b', '=', 'y'), Condition('c', '=', 'z'))) in node.items
+
+
+def test_restrict_keeps_original_text():
+    query = r'body~="\d{3}"  ||  title="b"'
+    assert restrict(query, condition('type', 'service')) == r'(body~="\d{3}"  ||  title="b") && type="service"'
+    assert restrict('banner="x', condition('type', 'service', op='!=')) == '(banner="x) && type!="service"'
+
+
+@pytest.mark.parametrize('query', ['', 'title="x" &&', '(a="b"', 'a="b")', 'title', 'a="unterminated'])
+def test_syntax_errors(query):
+    with pytest.raises(QueryError):
+        parse(query)